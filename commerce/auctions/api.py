@@ -0,0 +1,220 @@
+"""Read-only JSON API, version 1, for mobile and partner clients.
+
+Queries select only the columns asked for with `?fields=` (all of them
+by default), lists are keyset-paginated with `?cursor=` and `?limit=`
+and return the cursor of the next page, and errors are
+{"error": message}. Responses are encoded with orjson when installed and
+compressed with Brotli (if installed) or gzip, as the client accepts.
+"""
+import functools
+import gzip
+import json
+import re
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from . import history
+from .categories import catalogue
+from .models import Listing
+from .pagination import paginate_newest_first
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# API field -> column or expression, of the listings list and of a listing
+LISTING_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "price": F("current_bid_amount"),
+    "bid_count": "bid_count",
+    "category_id": "category_id",
+    "seller": F("author__username"),
+    "image": F("img_url"),
+    "created_at": "created_at",
+    "ends_at": "ends_at",
+}
+LISTING_DETAIL_FIELDS = {
+    **LISTING_FIELDS,
+    "description": "description",
+    "active": "active",
+    "leader": F("current_bidder__username"),
+    "won_by": F("winner__username"),
+}
+BID_FIELDS = ("id", "amount", "bidder", "created_at")
+CATEGORY_FIELDS = ("id", "title", "active_count")
+
+MAX_LIMIT = 100
+# Smaller bodies gain nothing from compression
+MIN_COMPRESS_BYTES = 200
+
+
+class APIError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    raise TypeError(f"Can't encode {type(value).__name__}")
+
+
+def dumps(data):
+    """Encode `data` as compact JSON bytes, the same with or without orjson."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, default=_default,
+                      separators=(",", ":")).encode()
+
+
+def _accepted_encodings(request):
+    """The content codings of Accept-Encoding, except those with q=0."""
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _json(request, data, status=200):
+    body = dumps(data)
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        accepted = _accepted_encodings(request)
+        if brotli is not None and "br" in accepted:
+            body, encoding = brotli.compress(body, quality=5), "br"
+        elif "gzip" in accepted:
+            body, encoding = gzip.compress(body, compresslevel=6,
+                                           mtime=0), "gzip"
+    response = HttpResponse(body, content_type="application/json",
+                            status=status)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def api_view(view):
+    """Answer GET and HEAD only, turning APIErrors into JSON errors."""
+    @require_safe
+    @functools.wraps(view)
+    def inner(request, *args, **kwargs):
+        try:
+            return _json(request, view(request, *args, **kwargs))
+        except APIError as exc:
+            return _json(request, {"error": str(exc)}, status=exc.status)
+    return inner
+
+
+def _fields(request, available):
+    """Return the fields asked for with ?fields=, all of them by default."""
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(available)
+    fields = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        raise APIError(f"Unknown fields: {', '.join(unknown) or raw!r}.")
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get("limit", settings.AUCTIONS_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise APIError(f"limit must be between 1 and {MAX_LIMIT}.")
+    return limit
+
+
+def _values(queryset, spec, fields):
+    """`queryset.values()` of exactly the columns behind `fields`."""
+    plain = [name for name in fields if spec[name] == name]
+    expressions = {name: spec[name] for name in fields if name not in plain}
+    return queryset.values(*plain, **expressions)
+
+
+def _pick(rows, fields):
+    return [{name: row[name] for name in fields} for row in rows]
+
+
+@api_view
+def listings(request):
+    """Active listings, newest first, optionally of one category (?cat=)."""
+    fields = _fields(request, LISTING_FIELDS)
+    queryset = Listing.objects.filter(active=True)
+    cat = request.GET.get("cat")
+    if cat is not None:
+        # ASCII digits only, as str.isdigit() and int() also take others,
+        # and few enough to fit the database's integers
+        if not re.fullmatch(r"[0-9]{1,18}", cat):
+            raise APIError("Invalid category.")
+        queryset = queryset.filter(category=cat)
+    # The sort key is needed for the cursor even when not asked for
+    rows = _values(queryset, LISTING_FIELDS,
+                   list(dict.fromkeys(fields + ["id", "created_at"])))
+    try:
+        page = paginate_newest_first(rows, request.GET.get("cursor"),
+                                     _limit(request))
+    except ValueError:
+        raise APIError("Invalid cursor.")
+    return {"listings": _pick(page.items, fields),
+            "next_cursor": page.next_cursor}
+
+
+@api_view
+def listing(request, pk):
+    """One listing, open or closed."""
+    fields = _fields(request, LISTING_DETAIL_FIELDS)
+    row = _values(Listing.objects.filter(pk=pk), LISTING_DETAIL_FIELDS,
+                  fields).first()
+    if row is None:
+        raise APIError("No such listing.", status=404)
+    return row
+
+
+@api_view
+def listing_bids(request, pk):
+    """Bids of a listing, oldest first."""
+    fields = _fields(request, BID_FIELDS)
+    limit = _limit(request)
+    if not Listing.objects.filter(pk=pk).exists():
+        raise APIError("No such listing.", status=404)
+    try:
+        page = history.bid_page(pk, request.GET.get("cursor"), limit)
+    except ValueError:
+        raise APIError("Invalid cursor.")
+    return {"bids": _pick(page.items, fields),
+            "next_cursor": page.next_cursor}
+
+
+@api_view
+def categories(request):
+    """Every category with its number of active listings."""
+    fields = _fields(request, CATEGORY_FIELDS)
+    return {"categories": _pick(catalogue(), fields)}
@@ -0,0 +1,111 @@
+"""Bid placement engine.
+
+`place_bid` is the only place that should create bids on a live listing.
+It checks and records a bid inside one transaction so two concurrent
+bidders can never both beat the same price:
+
+* on databases with row locks the listing row is taken with
+  `select_for_update` before the checks run;
+* on SQLite, which has no row locks, the price is claimed with a
+  compare-and-swap UPDATE (`current_bid_amount < amount`) and the whole
+  transaction is retried when the database reports a lock conflict.
+"""
+import enum
+import time
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Bid, Listing
+
+
+class BidStatus(enum.Enum):
+    ACCEPTED = "accepted"
+    OUTBID = "outbid"
+    CLOSED = "closed"
+    SELF_BID = "self-bid"
+    NOT_FOUND = "not-found"
+
+
+@dataclass(frozen=True)
+class BidResult:
+    status: BidStatus
+    listing_id: int
+    amount: Decimal
+    current_amount: Optional[Decimal] = None
+    bid: Optional[Bid] = None
+
+    @property
+    def accepted(self):
+        return self.status is BidStatus.ACCEPTED
+
+
+CENT = Decimal("0.01")
+
+
+def place_bid(listing_id, user, amount, max_retries=5, backoff=0.01):
+    """Try to place a bid of `amount` by `user` and return a `BidResult`.
+
+    `amount` is rounded to the cent; prices are compared as decimals so
+    there is no float rounding in the "strictly higher" rule.
+    """
+    amount = Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP)
+    for attempt in range(max_retries + 1):
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                if connection.features.has_select_for_update:
+                    return _place_locked(listing_id, user, amount, now)
+                return _place_cas(listing_id, user, amount, now)
+        except OperationalError as exc:
+            if attempt == max_retries or "locked" not in str(exc):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def _place_locked(listing_id, user, amount, now):
+    listing = Listing.objects.select_for_update().filter(pk=listing_id).first()
+    rejection = _check(listing, listing_id, user, amount, now)
+    if rejection is not None:
+        return rejection
+    # The post_save handler moves the price inside this same transaction
+    bid = Bid.objects.create(user=user, listing_id=listing_id,
+                             ammount=amount, created_at=now)
+    return BidResult(BidStatus.ACCEPTED, listing_id, amount, amount, bid)
+
+
+def _place_cas(listing_id, user, amount, now):
+    # Claim the price first: writing before reading keeps SQLite from
+    # having to upgrade a read lock, which is what deadlocks writers
+    claimed = Listing.objects.filter(
+        Q(ends_at__isnull=True) | Q(ends_at__gt=now),
+        pk=listing_id, active=True, current_bid_amount__lt=amount).exclude(
+        author=user).update(current_bid_amount=amount, current_bidder=user)
+    if not claimed:
+        listing = Listing.objects.filter(pk=listing_id).first()
+        return _check(listing, listing_id, user, amount, now)
+    # The price already matches, so the post_save handler only counts it
+    bid = Bid.objects.create(user=user, listing_id=listing_id,
+                             ammount=amount, created_at=now)
+    return BidResult(BidStatus.ACCEPTED, listing_id, amount, amount, bid)
+
+
+def _check(listing, listing_id, user, amount, now):
+    """Return a rejected `BidResult`, or None if the bid can go in."""
+    if listing is None:
+        return BidResult(BidStatus.NOT_FOUND, listing_id, amount)
+    # Past its end time counts as closed, even before the scheduler runs
+    if not listing.active or (listing.ends_at is not None
+                              and listing.ends_at <= now):
+        status = BidStatus.CLOSED
+    elif listing.author_id == user.id:
+        status = BidStatus.SELF_BID
+    elif amount <= listing.current_bid_amount:
+        status = BidStatus.OUTBID
+    else:
+        return None
+    return BidResult(status, listing_id, amount, listing.current_bid_amount)
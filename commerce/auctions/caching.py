@@ -0,0 +1,275 @@
+"""Versioned caching of the public parts of auction pages.
+
+Every listing has a version counter in the cache, and so does the feed
+of active listings. Cached fragments embed the version they were built
+from in their key, so invalidating is just bumping a counter (see
+auctions.signals): stale entries are never looked up again and simply
+expire. Counters expire too, so looking up listings that don't exist
+leaves nothing behind for good. Counters that are missing, e.g. after an
+eviction or once expired, restart from the current time rather than from
+zero so an old fragment can't match them by accident.
+
+Only data that looks the same to every visitor is cached here; per-user
+bits like the watchlist button are rendered by the views on each request.
+
+Misses are built from the primary database. Counters are bumped as soon
+as it commits, and a replica that has not caught up yet would otherwise
+store the old data under the new version until the next change.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import routing
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.AUCTIONS_CACHE_ALIAS]
+
+
+class _InProcessCache:
+    """The async methods used here, for a cache in this process's memory.
+
+    Django's default async methods run the sync ones in a thread, and
+    aget_many() does so once per key: with the local memory cache, a
+    round trip to the request's thread for each dict lookup, dozens a
+    page. There is no I/O to wait on, so they are called directly.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    async def aget(self, key, default=None):
+        return self._cache.get(key, default)
+
+    async def aget_many(self, keys):
+        return self._cache.get_many(keys)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self._cache.add(key, value, timeout)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._cache.set(key, value, timeout)
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT):
+        return self._cache.set_many(data, timeout)
+
+
+def aget_cache():
+    """get_cache() for async code, which awaits its a* methods."""
+    cache = get_cache()
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return _InProcessCache(cache)
+    return cache
+
+
+def cache_stats():
+    """Return the hit and miss counters of this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _record(kind, hits=0, misses=0):
+    with _stats_lock:
+        _stats[f"{kind}_hits"] += hits
+        _stats[f"{kind}_misses"] += misses
+
+
+def _version_key(name):
+    return f"auctions:version:{name}"
+
+
+def _versions(names):
+    cache = get_cache()
+    keys = {name: _version_key(name) for name in names}
+    found = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in found:
+            cache.add(key, time.time_ns(),
+                      timeout=settings.AUCTIONS_CACHE_VERSION_TIMEOUT)
+            found[key] = cache.get(key)
+    return {name: found[key] for name, key in keys.items()}
+
+
+async def _aversions(names):
+    cache = aget_cache()
+    keys = {name: _version_key(name) for name in names}
+    found = await cache.aget_many(keys.values())
+    for key in keys.values():
+        if key not in found:
+            await cache.aadd(key, time.time_ns(),
+                             timeout=settings.AUCTIONS_CACHE_VERSION_TIMEOUT)
+            found[key] = await cache.aget(key)
+    return {name: found[key] for name, key in keys.items()}
+
+
+def _bump(names):
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            # Never cached, nothing to invalidate
+            pass
+
+
+@contextmanager
+def _from_primary():
+    token = routing.use_primary.set(True)
+    try:
+        yield
+    finally:
+        routing.use_primary.reset(token)
+
+
+def _cached(kind, key, build):
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        _record(kind, hits=1)
+        return value
+    _record(kind, misses=1)
+    with _from_primary():
+        value = build()
+    cache.set(key, value, settings.AUCTIONS_CACHE_TIMEOUT)
+    return value
+
+
+async def _acached(kind, key, abuild):
+    cache = aget_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        _record(kind, hits=1)
+        return value
+    _record(kind, misses=1)
+    with _from_primary():
+        value = await abuild()
+    await cache.aset(key, value, settings.AUCTIONS_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate_listings(listing_ids, feed=False):
+    """Drop the cached fragments of `listing_ids`, and the feed pages if `feed`."""
+    names = [f"listing:{pk}" for pk in listing_ids]
+    if feed:
+        names.append("feed")
+    _bump(names)
+
+
+def invalidate_categories():
+    _bump(["categories"])
+
+
+def _token_names(listing_ids, feed, categories):
+    names = [f"listing:{pk}" for pk in listing_ids]
+    if feed:
+        names.append("feed")
+    if categories:
+        names.append("categories")
+    return names
+
+
+def _token(names, versions):
+    joined = "|".join(f"{name}={versions[name]}" for name in names)
+    return hashlib.sha1(joined.encode()).hexdigest()[:16]
+
+
+def version_token(listing_ids=(), feed=False, categories=False):
+    """Return a short token that changes whenever the given data changes.
+
+    Built from the version counters alone, so it costs one cache lookup
+    and no queries; the views use it as their ETag.
+    """
+    names = _token_names(listing_ids, feed, categories)
+    return _token(names, _versions(names))
+
+
+async def aversion_token(listing_ids=(), feed=False, categories=False):
+    names = _token_names(listing_ids, feed, categories)
+    return _token(names, await _aversions(names))
+
+
+# The cached_* functions call `build()` on a miss; the acached_* ones, for
+# the async views, await `abuild()` instead.
+
+def cached_categories(build):
+    """Return the category catalogue."""
+    version = _versions(["categories"])["categories"]
+    return _cached("categories", f"auctions:categories:{version}", build)
+
+
+async def acached_categories(abuild):
+    version = (await _aversions(["categories"]))["categories"]
+    return await _acached("categories", f"auctions:categories:{version}",
+                          abuild)
+
+
+async def acached_listing_page(pk, abuild):
+    """Return the public data of the listing page."""
+    version = (await _aversions([f"listing:{pk}"]))[f"listing:{pk}"]
+    return await _acached("listing", f"auctions:listing:{pk}:{version}",
+                          abuild)
+
+
+async def acached_listing_exists(pk, abuild):
+    """Return whether listing `pk` exists."""
+    version = (await _aversions([f"listing:{pk}"]))[f"listing:{pk}"]
+    return await _acached("exists", f"auctions:exists:{pk}:{version}",
+                          abuild)
+
+
+def cached_comments_page(pk, cursor, build):
+    """Return a rendered page of a listing's comments."""
+    version = _versions([f"listing:{pk}"])[f"listing:{pk}"]
+    return _cached("comments", f"auctions:comments:{pk}:{version}:{cursor}",
+                   build)
+
+
+async def acached_feed_page(cat, cursor, page_size, abuild):
+    """Return the (listing ids, next cursor) of a feed page."""
+    version = (await _aversions(["feed"]))["feed"]
+    return await _acached(
+        "feed", f"auctions:feed:{version}:{cat}:{cursor}:{page_size}", abuild)
+
+
+def _card_keys(listing_ids, versions):
+    return {pk: f"auctions:card:{pk}:{versions[f'listing:{pk}']}"
+            for pk in listing_ids}
+
+
+async def acached_cards(listing_ids, abuild):
+    """Return the rendered index cards of `listing_ids`, in order.
+
+    `abuild(missing_ids)` must return a {listing id: html} dict for the
+    cards that are not cached; ids it leaves out are skipped.
+    """
+    cache = aget_cache()
+    keys = _card_keys(listing_ids, await _aversions(
+        [f"listing:{pk}" for pk in listing_ids]))
+    found = await cache.aget_many(keys.values())
+    cards = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = [pk for pk in listing_ids if pk not in cards]
+    _record("card", hits=len(cards), misses=len(missing))
+    if missing:
+        with _from_primary():
+            built = await abuild(missing)
+        await cache.aset_many({keys[pk]: html for pk, html in built.items()},
+                              settings.AUCTIONS_CACHE_TIMEOUT)
+        cards.update(built)
+    return [cards[pk] for pk in listing_ids if pk in cards]
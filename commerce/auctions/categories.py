@@ -0,0 +1,34 @@
+"""The category catalogue: every category with its active listing count.
+
+Built from the denormalized Category.active_listing_count column and
+cached until a listing opens or closes or a category changes (see
+auctions.signals), so pages never count listings per request.
+"""
+from . import caching
+from .models import Category
+
+
+def _rows():
+    return Category.objects.order_by("title", "pk").values_list(
+        "id", "title", "active_listing_count")
+
+
+def _entry(pk, title, count):
+    return {"id": pk, "title": title, "active_count": count}
+
+
+def catalogue():
+    """Return [{"id", "title", "active_count"}] of every category, by title."""
+    return caching.cached_categories(
+        lambda: [_entry(*row) for row in _rows()])
+
+
+async def acatalogue():
+    async def build():
+        return [_entry(*row) async for row in _rows()]
+    return await caching.acached_categories(build)
+
+
+def category_choices():
+    """Choices of the category field of CreateListingForm."""
+    return [(category["id"], category["title"]) for category in catalogue()]
@@ -0,0 +1,132 @@
+"""Per-user digests of the auctions they follow: outbid, closing soon, won.
+
+Built in one pass over two streams, each a single query read in chunks
+with `iterator()` and ordered by user: the distinct (bidder, listing)
+pairs of the Bid table, for the listings a user was outbid on or won,
+and the User.watchlist rows of the listings closing soon. Merging them
+by user yields one digest at a time, so memory stays the same however
+many bids and watches there are.
+
+Digests are written to a sink, the class named in AUCTIONS_DIGEST_SINK:
+anything with `write(digest)` and `close()`.
+"""
+import heapq
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Bid
+from .watchlist import Watch
+
+# Columns of both streams, through the bidder or watcher and the listing
+_COLUMNS = ("user_id", "user__username", "user__email", "listing_id",
+            "listing__title", "listing__current_bid_amount",
+            "listing__ends_at", "listing__active")
+
+
+@dataclass
+class Digest:
+    user_id: int
+    username: str
+    email: str
+    outbid: list = field(default_factory=list)
+    closing_soon: list = field(default_factory=list)
+    won: list = field(default_factory=list)
+
+
+@dataclass
+class DigestStats:
+    rows: int = 0
+    digests: int = 0
+
+
+def _item(row):
+    return {"listing_id": row[3], "title": row[4], "price": row[5],
+            "ends_at": row[6]}
+
+
+def build_digests(now=None, period=timedelta(hours=24), chunk_size=2000,
+                  stats=None):
+    """Yield the Digest of every user with something to report, by user id.
+
+    A user is outbid on the open listings they bid on and no longer lead,
+    closing soon lists the watched listings ending within `period`, and
+    won the listings they won that closed within the last `period`.
+    Sellers' initial bids don't count. Adds to `stats` as it goes.
+    """
+    now = now or timezone.now()
+    stats = stats if stats is not None else DigestStats()
+    bids = Bid.objects.exclude(listing__author=F("user")).filter(
+        Q(listing__active=True) & ~Q(listing__current_bidder=F("user"))
+        | Q(listing__active=False, listing__winner=F("user"),
+            listing__closed_at__gt=now - period)
+    ).values_list(*_COLUMNS).distinct().order_by("user_id", "listing_id")
+    watches = Watch.objects.filter(
+        listing__active=True, listing__ends_at__gt=now,
+        listing__ends_at__lte=now + period,
+    ).values_list(*_COLUMNS).order_by("user_id", "listing_id")
+
+    rows = heapq.merge(
+        ((row, "bid") for row in bids.iterator(chunk_size=chunk_size)),
+        ((row, "watch") for row in watches.iterator(chunk_size=chunk_size)),
+        key=lambda entry: entry[0][0])
+    for user_id, entries in groupby(rows, key=lambda entry: entry[0][0]):
+        digest = None
+        for row, source in entries:
+            stats.rows += 1
+            if digest is None:
+                digest = Digest(*row[:3])
+            if source == "watch":
+                digest.closing_soon.append(_item(row))
+            elif row[7]:
+                digest.outbid.append(_item(row))
+            else:
+                digest.won.append(_item(row))
+        stats.digests += 1
+        yield digest
+
+
+class ConsoleSink:
+    """Write digests as text, to standard output by default."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, digest):
+        lines = [f"Digest for {digest.username} <{digest.email}>"]
+        for title, items in (("Outbid", digest.outbid),
+                             ("Closing soon", digest.closing_soon),
+                             ("Won", digest.won)):
+            lines.extend(f"  {title}: {item['title']} (${item['price']})"
+                         for item in items)
+        self.stream.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.stream.flush()
+
+
+class FileSink:
+    """Append digests to `path` as JSON lines, ready for a mailer."""
+
+    def __init__(self, path="digests.jsonl"):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, digest):
+        self.file.write(json.dumps(asdict(digest), cls=DjangoJSONEncoder)
+                        + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def get_sink(name=None, **kwargs):
+    """Return an instance of the sink class `name`, or AUCTIONS_DIGEST_SINK."""
+    return import_string(name or settings.AUCTIONS_DIGEST_SINK)(**kwargs)
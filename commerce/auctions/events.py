@@ -0,0 +1,162 @@
+"""Publish/subscribe of live listing events (new bids, comments, closes).
+
+Signal handlers publish to the channel of a listing once the change is
+committed, and the `/listing/<pk>/events` Server-Sent Events stream
+subscribes to it. The broker class is set by AUCTIONS_EVENT_BROKER, so
+the in-process broker can be swapped for one backed by an external
+message bus when running several workers; it only needs `publish` and
+`subscribe`.
+"""
+import asyncio
+import functools
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """Events of one channel for one consumer, read with `get()`.
+
+    It is just an asyncio queue, so idle subscribers cost no task or
+    thread. A consumer that falls more than `queue_size` events behind is
+    dropped: its backlog is discarded and `get()` returns None.
+    """
+
+    def __init__(self, broker, channel, queue_size):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def _put(self, event):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Skip the backlog so the consumer hears about it right away
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """Return the next event, None if dropped; raise TimeoutError on timeout."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan events out to the subscribers of this process.
+
+    `publish` may be called from any thread. Subscribers are grouped by
+    event loop so a publish wakes each loop once, however many of its
+    subscribers listen to the channel.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        # channel -> event loop -> subscriptions
+        self._channels = defaultdict(lambda: defaultdict(set))
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels[channel][subscription.loop].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            loops = self._channels.get(subscription.channel)
+            if loops is None:
+                return
+            subscriptions = loops.get(subscription.loop, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                loops.pop(subscription.loop, None)
+            if not loops:
+                del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            targets = [(loop, list(subscriptions)) for loop, subscriptions
+                       in self._channels.get(channel, {}).items()]
+        for loop, subscriptions in targets:
+            try:
+                loop.call_soon_threadsafe(_fan_out, subscriptions, event)
+            except RuntimeError:
+                # The loop was closed under its subscribers
+                pass
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            channels = ([self._channels.get(channel, {})] if channel is not None
+                        else list(self._channels.values()))
+            return sum(len(subscriptions) for loops in channels
+                       for subscriptions in loops.values())
+
+
+def _fan_out(subscriptions, event):
+    for subscription in subscriptions:
+        subscription._put(event)
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.AUCTIONS_EVENT_BROKER)()
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+def publish_listing_event(listing_id, event_type, **data):
+    get_broker().publish(listing_channel(listing_id),
+                         {"type": event_type, "listing_id": listing_id, **data})
+
+
+def format_sse(event):
+    """Serialize an event as a Server-Sent Events message."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _close_connection():
+    connection.close()
+
+
+async def release_request_thread():
+    """Let go of the worker thread Django keeps for this ASGI request.
+
+    The thread-sensitive calls of a request, those of the stock middleware
+    included, share a thread, with its database connection, that is kept
+    until the response is finished: for an event stream, until the client
+    leaves. Streams call this once the middleware is done with the
+    request; any later call starts a new thread.
+
+    This relies on how asgiref (3.8 to 3.12) keeps those threads, which is
+    not public API: with any other layout the thread is simply kept.
+    """
+    context_var = getattr(SyncToAsync, "thread_sensitive_context", None)
+    executors = getattr(SyncToAsync, "context_to_thread_executor", None)
+    if context_var is None or executors is None:
+        return
+    try:
+        context = context_var.get()
+    except LookupError:
+        return
+    if context not in executors:
+        return
+    # The connection belongs to that thread, so it is closed from there
+    await sync_to_async(_close_connection)()
+    executor = executors.pop(context, None)
+    if executor is not None:
+        executor.shutdown(wait=False)
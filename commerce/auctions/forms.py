@@ -1,18 +1,28 @@
 from django import forms
-from .models import Category
+from .categories import category_choices
 
 
 class CreateListingForm(forms.Form):
-    categories = Category.objects.all()
 
     title = forms.CharField(max_length=64,
                             required=True)
     description = forms.CharField(max_length=300,
                                   widget=forms.Textarea,
                                   required=True)
-    base_bid = forms.FloatField(min_value=1.0,
-                                required=True)
+    base_bid = forms.DecimalField(min_value=1,
+                                  max_digits=12,
+                                  decimal_places=2,
+                                  required=True)
     img_url = forms.URLField(required=False,
                              empty_value='https://st4.depositphotos.com/14953852/24787/v/450/depositphotos_247872612-stock-illustration-no-image-available-icon-vector.jpg')
-    category = forms.ModelChoiceField(queryset=categories,
+    # Read from the cached catalogue each time the form is built
+    category = forms.TypedChoiceField(choices=category_choices,
+                                      coerce=int,
+                                      required=True)
+    duration = forms.TypedChoiceField(choices=[(1, "1 day"),
+                                               (3, "3 days"),
+                                               (7, "7 days"),
+                                               (14, "14 days")],
+                                      coerce=int,
+                                      initial=7,
                                       required=True)
@@ -0,0 +1,80 @@
+"""Price history of a listing, as raw bids or downsampled OHLC buckets."""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Count, DateTimeField, F, Func, Max, Min, Value
+from django.db.models.functions import Trunc
+
+from .bidding import CENT
+from .models import Bid
+from .pagination import (decode_time_cursor, encode_time_cursor,
+                         paginate_oldest_first)
+
+# Interval name -> (Trunc kind, strftime format for SQLite, bucket width)
+INTERVALS = {
+    "minute": ("minute", "%Y-%m-%d %H:%M:00", timedelta(minutes=1)),
+    "hour": ("hour", "%Y-%m-%d %H:00:00", timedelta(hours=1)),
+    "day": ("day", "%Y-%m-%d 00:00:00", timedelta(days=1)),
+}
+
+
+def bid_page(listing_id, cursor=None, limit=100):
+    """Return a `KeysetPage` of the bids of a listing, oldest first."""
+    bids = Bid.objects.filter(listing_id=listing_id).values(
+        "id", "created_at", amount=F("ammount"), bidder=F("user__username"))
+    return paginate_oldest_first(bids, cursor, limit)
+
+
+def _bucket_start(interval):
+    """Expression for the UTC start of the bucket holding a bid."""
+    kind, fmt, _ = INTERVALS[interval]
+    if connection.vendor == "sqlite":
+        # Django's Trunc runs a Python function per row on SQLite, which
+        # dominates the query; strftime() is native and the dates are UTC
+        return Func(Value(fmt), F("created_at"), function="strftime",
+                    output_field=DateTimeField())
+    return Trunc("created_at", kind, tzinfo=dt_timezone.utc)
+
+
+def ohlc_buckets(listing_id, interval, cursor=None, limit=100):
+    """Return (buckets, next cursor) of open/high/low/close prices per interval.
+
+    High, low and count come from one GROUP BY over the listing's bids,
+    together with the first and last bid of each bucket; a primary key
+    lookup then fetches the opening and closing prices. Bids are append
+    only, so their ids follow their creation time. The cursor holds the
+    start of the next bucket, encoded like the keyset cursors. Raises
+    ValueError for an unknown interval or invalid cursor.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval!r}")
+    bids = Bid.objects.filter(listing_id=listing_id)
+    if cursor:
+        bids = bids.filter(created_at__gte=decode_time_cursor(cursor))
+
+    rows = list(bids.values(start=_bucket_start(interval)).annotate(
+        high=Max("ammount"),
+        low=Min("ammount"),
+        bids=Count("id"),
+        first_id=Min("id"),
+        last_id=Max("id"),
+    ).order_by("start")[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_time_cursor(
+            rows[-1]["start"] + INTERVALS[interval][2])
+
+    edges = {row[key] for row in rows for key in ("first_id", "last_id")}
+    amounts = dict(Bid.objects.filter(pk__in=edges)
+                   .values_list("id", "ammount"))
+    return [{
+        "start": row["start"],
+        "open": amounts[row["first_id"]],
+        # SQLite hands back aggregates unquantized
+        "high": row["high"].quantize(CENT),
+        "low": row["low"].quantize(CENT),
+        "close": amounts[row["last_id"]],
+        "bids": row["bids"],
+    } for row in rows], next_cursor
@@ -0,0 +1,71 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from auctions import api
+from auctions.models import Listing
+
+from .bench_views import percentile
+
+
+class Command(BaseCommand):
+    help = ("Compare the JSON API with the HTML pages it replaces: latency "
+            "percentiles and response bytes, plain and compressed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--warmup", type=int, default=5)
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by(
+            "-bid_count", "pk").first()
+        if listing is None:
+            raise CommandError("No active listings, run seed_auctions first.")
+
+        pairs = [
+            ("index", reverse("index"), reverse("api-listings")),
+            ("listing", reverse("listing", args=(listing.id,)),
+             reverse("api-listing", args=(listing.id,))),
+            ("categories", reverse("categories"), reverse("api-categories")),
+        ]
+        self.stdout.write(f"{'page':<12}{'format':>8}{'p50 ms':>10}"
+                          f"{'p99 ms':>10}{'bytes':>10}{'gzip':>10}{'br':>10}")
+        setup_test_environment()
+        try:
+            for name, html_url, api_url in pairs:
+                for kind, url in (("html", html_url), ("json", api_url)):
+                    p50, p99, plain = self.bench(url, options)
+                    self.stdout.write(
+                        f"{name:<12}{kind:>8}{p50:>10.2f}{p99:>10.2f}"
+                        f"{len(plain):>10}"
+                        f"{len(gzip.compress(plain, compresslevel=6)):>10}"
+                        f"{self.brotli_size(plain):>10}")
+        finally:
+            teardown_test_environment()
+
+    def bench(self, url, options):
+        client = Client()
+        timings = []
+        for i in range(options["warmup"] + options["requests"]):
+            # Clients that accept compression, as browsers and apps do
+            started = time.perf_counter()
+            response = client.get(url, headers={
+                "Accept-Encoding": "br, gzip"})
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise CommandError(f"Got {response.status_code} from {url}.")
+            if i >= options["warmup"]:
+                timings.append(elapsed)
+        timings.sort()
+        # Sizes of the uncompressed body, for every format alike
+        plain = client.get(url).content
+        return percentile(timings, 50), percentile(timings, 99), plain
+
+    def brotli_size(self, data):
+        if api.brotli is None:
+            return "-"
+        return len(api.brotli.compress(data, quality=5))
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from auctions.models import Listing
+
+from .bench_views import percentile
+
+
+class Command(BaseCommand):
+    help = ("Load the async pages in-process, through the WSGI application "
+            "with a pool of threads and through the ASGI application with "
+            "as many concurrent tasks, and report throughput and latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=64,
+                            help="Threads for WSGI, tasks for ASGI.")
+        parser.add_argument("--requests", type=int, default=2000,
+                            help="Requests per page and server.")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by(
+            "-bid_count", "pk").select_related("author").first()
+        if listing is None:
+            raise CommandError("No active listings, run seed_auctions first.")
+        client = Client()
+        client.force_login(listing.author)
+        cookie = f"{settings.SESSION_COOKIE_NAME}=" \
+                 f"{client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        from commerce.asgi import application as asgi_application
+        from commerce.wsgi import application as wsgi_application
+
+        paths = [reverse("index"), reverse("listing", args=(listing.id,)),
+                 reverse("categories"), reverse("watchlist")]
+        self.stdout.write(f"{'page':<22}{'server':>8}{'req/s':>10}"
+                          f"{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for path in paths:
+            for server, run in (("wsgi", self.run_wsgi),
+                                ("asgi", self.run_asgi)):
+                application = (wsgi_application if server == "wsgi"
+                               else asgi_application)
+                # Warm up the caches and connections, then measure
+                run(application, path, cookie, options["concurrency"],
+                    options["concurrency"])
+                seconds, timings, errors = run(
+                    application, path, cookie, options["concurrency"],
+                    options["requests"])
+                timings.sort()
+                self.stdout.write(
+                    f"{path:<22}{server:>8}{len(timings) / seconds:>10.0f}"
+                    f"{percentile(timings, 50):>10.2f}"
+                    f"{percentile(timings, 99):>10.2f}{errors:>8}")
+
+    def run_wsgi(self, application, path, cookie, concurrency, requests):
+        timings = []
+        errors = 0
+        lock = threading.Lock()
+
+        def request(_):
+            nonlocal errors
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+                "SERVER_NAME": "localhost", "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1", "HTTP_HOST": "localhost",
+                "HTTP_COOKIE": cookie, "wsgi.version": (1, 0),
+                "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(),
+                "wsgi.errors": sys.stderr, "wsgi.multithread": True,
+                "wsgi.multiprocess": False, "wsgi.run_once": False,
+            }
+            statuses = []
+            started = time.perf_counter()
+            body = application(environ, lambda status, headers:
+                               statuses.append(status))
+            b"".join(body)
+            body.close()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                timings.append(elapsed)
+                if not statuses[0].startswith("200"):
+                    errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(request, range(requests)))
+        return time.perf_counter() - started, timings, errors
+
+    def run_asgi(self, application, path, cookie, concurrency, requests):
+        return asyncio.run(self._run_asgi(application, path, cookie,
+                                          concurrency, requests))
+
+    async def _run_asgi(self, application, path, cookie, concurrency,
+                        requests):
+        timings = []
+        errors = 0
+        remaining = requests
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path,
+            "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"cookie", cookie.encode())],
+            "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+        }
+
+        async def request():
+            nonlocal errors
+            done = asyncio.Event()
+            body_sent = False
+            status = None
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": b"",
+                            "more_body": False}
+                await done.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                elif not message.get("more_body"):
+                    done.set()
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            timings.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors += 1
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await request()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, timings, errors
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import events
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = ("Load-test the live events stream: open many idle subscribers "
+            "against the ASGI application in-process, publish events and "
+            "report memory and threads per subscriber and delivery latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=50)
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by("pk").first()
+        if listing is None:
+            raise CommandError("No active listings, run seed_auctions first.")
+        asyncio.run(self.run(listing.id, options["subscribers"],
+                             options["events"]))
+
+    async def run(self, listing_id, subscribers, event_count):
+        from commerce.asgi import application
+
+        broker = events.get_broker()
+        channel = events.listing_channel(listing_id)
+        path = f"/listing/{listing_id}/events"
+        latencies = []
+        disconnect = asyncio.Event()
+
+        async def receive_messages():
+            yield {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            yield {"type": "http.disconnect"}
+
+        async def subscriber():
+            messages = receive_messages()
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"},
+                "http_version": "1.1", "method": "GET", "scheme": "http",
+                "path": path, "raw_path": path.encode(), "query_string": b"",
+                "root_path": "", "headers": [(b"host", b"localhost")],
+                "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+            }
+
+            async def send(message):
+                if message["type"] != "http.response.body":
+                    return
+                for chunk in message.get("body", b"").decode().split("\n\n"):
+                    if chunk.startswith("event: bench"):
+                        event = json.loads(chunk.split("data: ", 1)[1])
+                        latencies.append(time.perf_counter() - event["sent"])
+
+            await application(scope, messages.__anext__, send)
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        baseline_threads = threading.active_count()
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber()) for _ in range(subscribers)]
+        while broker.subscriber_count(channel) < subscribers:
+            await asyncio.sleep(0.01)
+        connect_seconds = time.perf_counter() - started
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / subscribers
+        tracemalloc.stop()
+        # Worker threads kept open by the streams, and their connections
+        threads = threading.active_count()
+
+        for _ in range(event_count):
+            events.publish_listing_event(listing_id, "bench",
+                                         sent=time.perf_counter())
+            await asyncio.sleep(0)
+        expected = subscribers * event_count
+        deadline = time.perf_counter() + 30
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        disconnect.set()
+        await asyncio.gather(*tasks)
+
+        latencies.sort()
+        self.stdout.write(
+            f"{subscribers} subscribers connected in {connect_seconds:.2f}s, "
+            f"~{per_subscriber / 1024:.1f} KiB each")
+        self.stdout.write(f"threads: {baseline_threads} before, "
+                          f"{threads} while connected")
+        self.stdout.write(f"{len(latencies)}/{expected} events delivered")
+        if latencies:
+            self.stdout.write(
+                f"latency ms: p50 {statistics.median(latencies) * 1000:.2f}, "
+                f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}, "
+                f"max {latencies[-1] * 1000:.2f}")
+        self.stdout.write(f"{broker.subscriber_count(channel)} subscribers left")
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from auctions import ratelimit
+from auctions.models import Listing, User
+
+from .bench_views import percentile
+
+BACKENDS = ("auctions.ratelimit.LocalMemoryBackend",
+            "auctions.ratelimit.CacheBackend")
+
+# Limits no benchmark reaches, so every request is allowed
+UNREACHABLE = (10 ** 9, 1)
+
+
+class Command(BaseCommand):
+    help = ("Measure what the rate limiter adds to allowed requests: the "
+            "cost of a token check per backend, and the latency of watchlist "
+            "toggles with and without limits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=100000)
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by("pk").first()
+        user = User.objects.exclude(pk=getattr(listing, "author_id", None)
+                                    ).order_by("pk").first()
+        if listing is None or user is None:
+            raise CommandError("No listings, run seed_auctions first.")
+
+        for backend in BACKENDS:
+            with override_settings(AUCTIONS_RATE_LIMIT_BACKEND=backend):
+                take = ratelimit.get_backend().take
+                started = time.perf_counter()
+                for i in range(options["checks"]):
+                    # A thousand clients, as in a busy process
+                    take(f"bench:user:{i % 1000}", *UNREACHABLE)
+                per_check = ((time.perf_counter() - started)
+                             / options["checks"] * 1e6)
+            self.stdout.write(f"{backend}: {per_check:.1f} us per check")
+
+        # The JSON toggle is decorated and goes through the middleware; an
+        # even number of requests leaves the watchlist as it was
+        url = reverse("watchlist-api", args=(listing.id,))
+        setup_test_environment()
+        try:
+            for name, limits in (("no limits", {}), ("limited", {
+                    "write": UNREACHABLE, "watchlist": UNREACHABLE})):
+                for backend in BACKENDS:
+                    with override_settings(AUCTIONS_RATE_LIMITS=limits,
+                                           AUCTIONS_RATE_LIMIT_BACKEND=backend):
+                        p50, p99 = self.bench(url, user, options["requests"])
+                    self.stdout.write(
+                        f"toggle, {name}, {backend.rsplit('.', 1)[1]}: "
+                        f"p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+                    if not limits:
+                        break
+        finally:
+            teardown_test_environment()
+
+    def bench(self, url, user, requests):
+        client = Client()
+        client.force_login(user)
+        timings = []
+        for i in range(requests * 2 + 10):
+            started = time.perf_counter()
+            response = client.post(url, "{}", content_type="application/json")
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise CommandError(f"Got {response.status_code} from {url}.")
+            if i >= 10:
+                timings.append(elapsed)
+        timings.sort()
+        return percentile(timings, 50), percentile(timings, 99)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from auctions import routing
+from auctions.models import Comment, Listing, User
+
+
+class Command(BaseCommand):
+    help = ("Measure read throughput of the index feed query with 0, 1, ... "
+            "of the configured read replicas, while a writer keeps adding "
+            "comments to the primary. Run sync_replicas first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=3.0)
+
+    def handle(self, *args, **options):
+        aliases = routing.replicas()
+        listing = Listing.objects.order_by("pk").first()
+        user = User.objects.order_by("pk").first()
+        if listing is None or user is None:
+            raise CommandError("No listings, run seed_auctions first.")
+
+        for count in range(len(aliases) + 1):
+            with override_settings(AUCTIONS_DB_REPLICAS=aliases[:count]):
+                reads, writes = self.run(listing, user, options["readers"],
+                                         options["seconds"])
+            self.stdout.write(
+                f"replicas: {count}, reads/s: {reads / options['seconds']:.0f}"
+                f", writes/s: {writes / options['seconds']:.0f}")
+        Comment.objects.filter(listing=listing,
+                               body="bench_replicas").delete()
+
+    def run(self, listing, user, readers, seconds):
+        stop = threading.Event()
+        counts = [0] * (readers + 1)
+
+        def read(slot):
+            try:
+                while not stop.is_set():
+                    list(Listing.objects.filter(active=True)
+                         .order_by("-created_at", "-pk")[:20])
+                    counts[slot] += 1
+            finally:
+                connections.close_all()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    with transaction.atomic():
+                        Comment.objects.create(
+                            author=user, listing=listing,
+                            body="bench_replicas", created_at=timezone.now())
+                    counts[-1] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=read, args=(slot,))
+                   for slot in range(readers)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return sum(counts[:-1]), counts[-1]
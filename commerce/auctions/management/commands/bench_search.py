@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from auctions import search
+from auctions.models import Listing
+
+from .bench_views import percentile
+
+
+class Command(BaseCommand):
+    help = ("Time full-text searches of the seeded listings, from common "
+            "single words to whole titles, and report latency percentiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Searches per query.")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--backend", choices=("fts5", "inverted"),
+                            help="Search backend (default: the one in use).")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by("pk").first()
+        if listing is None:
+            raise CommandError("No active listings, run seed_auctions first.")
+        words = search.tokenize(listing.title)
+        queries = [
+            ("one word", words[0], {}),
+            ("two words", " ".join(words[:2]), {}),
+            ("title", listing.title, {}),
+            ("one word in category", words[0],
+             {"category": listing.category_id}),
+            ("title, closed too", listing.title, {"active": None}),
+            ("no match", f"{words[0]} zzyzx", {}),
+        ]
+
+        backend = options["backend"] or getattr(
+            settings, "AUCTIONS_SEARCH_BACKEND", None)
+        with override_settings(AUCTIONS_SEARCH_BACKEND=backend):
+            self.stdout.write(
+                f"{Listing.objects.count()} listings, "
+                f"{search.get_backend().name} backend")
+            self.stdout.write(f"{'query':<24}{'results':>8}{'p50 ms':>10}"
+                              f"{'p95 ms':>10}{'p99 ms':>10}")
+            for name, query, filters in queries:
+                timings, results = self.bench(query, filters, options)
+                self.stdout.write(
+                    f"{name:<24}{results:>8}"
+                    f"{percentile(timings, 50):>10.2f}"
+                    f"{percentile(timings, 95):>10.2f}"
+                    f"{percentile(timings, 99):>10.2f}")
+
+    def bench(self, query, filters, options):
+        timings = []
+        for i in range(options["warmup"] + options["requests"]):
+            started = time.perf_counter()
+            results = search.search(query, limit=settings.AUCTIONS_PAGE_SIZE,
+                                    **filters)
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= options["warmup"]:
+                timings.append(elapsed)
+        timings.sort()
+        return timings, len(results)
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Q
+from django.test import override_settings
+from django.utils import timezone
+
+from auctions.bidding import place_bid
+from auctions.models import Listing, User
+
+# SQLite's own defaults, spelled out so they also undo a persisted WAL mode
+DEFAULT_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+
+
+class Command(BaseCommand):
+    help = ("Run reader and bid writer processes against the SQLite "
+            "database, first with SQLite's defaults and then with "
+            "AUCTIONS_SQLITE_PRAGMAS, and report throughput and errors.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=3.0)
+        parser.add_argument("--retries", type=int, default=0,
+                            help="Lock retries of each bid (default 0, to "
+                                 "count every lock error).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The default database is not SQLite.")
+        # Listings that stay open for longer than the runs
+        open_until = timezone.now() + timedelta(hours=1)
+        listing_ids = list(Listing.objects.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=open_until), active=True)
+            .values_list("pk", flat=True)[:100])
+        users = list(User.objects.order_by("pk")[:50])
+        if not listing_ids or len(users) < 2:
+            raise CommandError("No listings, run seed_auctions first.")
+
+        for name, pragmas in (("default", DEFAULT_PRAGMAS),
+                              ("tuned", settings.AUCTIONS_SQLITE_PRAGMAS)):
+            # Switch the journal mode once, here: changing it needs the
+            # database to itself, so the workers only get the other pragmas
+            with override_settings(AUCTIONS_SQLITE_PRAGMAS=pragmas):
+                connections.close_all()
+                connection.ensure_connection()
+                connections.close_all()
+            worker_pragmas = {key: value for key, value in pragmas.items()
+                              if key != "journal_mode"}
+            with override_settings(AUCTIONS_SQLITE_PRAGMAS=worker_pragmas):
+                totals = self.run(listing_ids, users, options)
+            seconds = options["seconds"]
+            attempts = totals["bids"] + totals["errors"]
+            self.stdout.write(
+                f"{name}: reads/s {totals['reads'] / seconds:.0f}, "
+                f"bids/s {totals['bids'] / seconds:.0f}, "
+                f"lock errors {totals['errors']} "
+                f"({100 * totals['errors'] / max(attempts, 1):.1f}% of bids), "
+                f"failed reads {totals['read_errors']}, "
+                f"slowest read {totals['max_read_ms']:.0f} ms")
+
+    def run(self, listing_ids, users, options):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        deadline = time.monotonic() + options["seconds"]
+        workers = [
+            context.Process(target=_read, args=(deadline, results))
+            for _ in range(options["readers"])
+        ] + [
+            context.Process(target=_bid, args=(
+                deadline, results, listing_ids, users, seed,
+                options["retries"]))
+            for seed in range(options["writers"])
+        ]
+        for worker in workers:
+            worker.start()
+        totals = {"reads": 0, "read_errors": 0, "bids": 0, "errors": 0,
+                  "max_read_ms": 0.0}
+        for _ in workers:
+            result = results.get()
+            for key, value in result.items():
+                totals[key] = (max(totals[key], value) if key == "max_read_ms"
+                               else totals[key] + value)
+        for worker in workers:
+            worker.join()
+        return totals
+
+
+def _read(deadline, results):
+    reads = read_errors = 0
+    slowest = 0.0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            list(Listing.objects.filter(active=True)
+                 .order_by("-created_at", "-pk")[:20])
+            reads += 1
+        except OperationalError:
+            read_errors += 1
+        slowest = max(slowest, time.perf_counter() - started)
+    connections.close_all()
+    results.put({"reads": reads, "read_errors": read_errors,
+                 "max_read_ms": slowest * 1000})
+
+
+def _bid(deadline, results, listing_ids, users, seed, retries):
+    rng = random.Random(seed)
+    bids = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            listing = Listing.objects.get(pk=rng.choice(listing_ids))
+            user = rng.choice([user for user in users
+                               if user.pk != listing.author_id])
+            place_bid(listing.pk, user, listing.current_bid_amount + 1,
+                      max_retries=retries)
+            bids += 1
+        except OperationalError:
+            errors += 1
+    connections.close_all()
+    results.put({"bids": bids, "errors": errors})
@@ -0,0 +1,49 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from auctions.models import Bid, Listing
+
+
+class Command(BaseCommand):
+    help = ("Time the top-bid lookup of random listings and show its query "
+            "plan, to compare bid storage and indexing changes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lookups", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        listing_ids = list(Listing.objects.values_list("pk", flat=True))
+        if not listing_ids:
+            raise CommandError("No listings, run seed_auctions first.")
+        rng = random.Random(options["seed"])
+
+        def top_bid(listing_id):
+            return Bid.objects.filter(listing_id=listing_id).order_by(
+                "-ammount").first()
+
+        sql, params = Bid.objects.filter(listing_id=listing_ids[0]).order_by(
+            "-ammount")[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        timings = []
+        for _ in range(options["lookups"]):
+            listing_id = rng.choice(listing_ids)
+            started = time.perf_counter()
+            top_bid(listing_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        self.stdout.write(f"bids: {Bid.objects.count()}, "
+                          f"listings: {len(listing_ids)}")
+        self.stdout.write("plan: " + "; ".join(plan))
+        self.stdout.write(
+            f"top bid lookup ms: p50 {statistics.median(timings):.3f}, "
+            f"p95 {timings[int(len(timings) * 0.95) - 1]:.3f}, "
+            f"max {timings[-1]:.3f}")
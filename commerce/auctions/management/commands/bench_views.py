@@ -0,0 +1,164 @@
+import io
+import json
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from PIL import Image
+
+from auctions import caching, thumbnails, urls
+from auctions.models import Listing
+
+
+def fixture_image(url):
+    """Thumbnail fetcher of the benchmark: a photo-sized JPEG for any URL."""
+    output = io.BytesIO()
+    Image.new("RGB", (1200, 900), "teal").save(output, "JPEG")
+    return output.getvalue(), "image/jpeg"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ("Drive every page of auctions/urls.py through the test client and "
+            "report latency percentiles and query counts per view.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Measured requests per view.")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--cold", action="store_true",
+                            help="Clear the page cache before every request.")
+        parser.add_argument("--only", nargs="*", default=None,
+                            help="URL names to benchmark, default all.")
+        parser.add_argument("--json", dest="json_path",
+                            help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by(
+            "-bid_count", "pk").select_related("author").first()
+        if listing is None:
+            raise CommandError("No active listings, run seed_auctions first.")
+        user = listing.author
+        thumbnail_dir = tempfile.TemporaryDirectory()
+
+        # Arguments and login needs of the URLs that take them, and the
+        # URLs skipped. Toggling the watchlist an even number of times
+        # leaves it as it was.
+        routes = {
+            "listing": {"args": (listing.id,)},
+            # An endless stream, load-tested by bench_events
+            "listing-events": {"skip": True},
+            "listing-comments": {"args": (listing.id,)},
+            # Made from a local image by the warmup requests, in a scratch
+            # directory, rather than fetched from the seeded URLs
+            "listing-thumbnail": {
+                "args": (listing.id, "card",
+                         thumbnails.url_hash(listing.img_url)),
+                "settings": {
+                    "AUCTIONS_THUMBNAIL_FETCHER":
+                        f"{__name__}.fixture_image",
+                    "AUCTIONS_THUMBNAIL_DIR": thumbnail_dir.name,
+                },
+            },
+            "close": {"args": (listing.id,), "login": True},
+            "set-watchlist": {"args": (listing.id,), "login": True},
+            "watchlist-api": {"args": (listing.id,), "login": True,
+                              "method": "post",
+                              "content_type": "application/json"},
+            "listing-history": {"args": (listing.id,),
+                                "query": {"interval": "hour"}},
+            "search": {"query": {"q": listing.title.split()[0]}},
+            "create-listing": {"login": True},
+            "my-listings": {"login": True},
+            "watchlist": {"login": True},
+            "logout": {"login": True},
+            "cache-stats": {"login": True},
+            "metrics": {"login": True},
+            "api-listing": {"args": (listing.id,)},
+            "api-listing-bids": {"args": (listing.id,)},
+        }
+
+        # Every request still takes a rate limit token, but one client
+        # sending thousands of writes is never turned away
+        unlimited = override_settings(AUCTIONS_RATE_LIMITS={
+            action: (10 ** 9, window)
+            for action, (_, window) in settings.AUCTIONS_RATE_LIMITS.items()
+        })
+        setup_test_environment()
+        unlimited.enable()
+        try:
+            results = []
+            for pattern in urls.urlpatterns:
+                name = pattern.name
+                if options["only"] and name not in options["only"]:
+                    continue
+                route = routes.get(name, {})
+                if route.get("skip"):
+                    continue
+                results.append(self.bench(name, route, user, options))
+        finally:
+            unlimited.disable()
+            teardown_test_environment()
+            thumbnail_dir.cleanup()
+
+        self.report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    def bench(self, name, route, user, options):
+        url = reverse(name, args=route.get("args", ()))
+        client = Client()
+        timings = []
+        queries = []
+        statuses = set()
+        extra = {"content_type": route["content_type"]} \
+            if "content_type" in route else {}
+        for i in range(options["warmup"] + options["requests"]):
+            if route.get("login"):
+                # Logging in again after /logout/ is not part of the timing
+                client.force_login(user)
+            if options["cold"]:
+                caching.get_cache().clear()
+            with override_settings(**route.get("settings", {})), \
+                    CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, route.get("method", "get"))(
+                    url, route.get("query", {}), **extra)
+                elapsed = time.perf_counter() - started
+            if i >= options["warmup"]:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+        timings.sort()
+        return {
+            "name": name,
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "p99_ms": percentile(timings, 99),
+            "queries": statistics.mean(queries),
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'view':<16}{'status':>10}{'p50 ms':>10}"
+                          f"{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+        for result in results:
+            status = ",".join(str(code) for code in result["status"])
+            self.stdout.write(
+                f"{result['name']:<16}{status:>10}{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['queries']:>10.1f}")
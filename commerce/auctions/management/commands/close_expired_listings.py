@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from auctions.scheduler import close_expired_listings
+
+
+class Command(BaseCommand):
+    help = "Close the listings whose end time has passed, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running, checking every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            closed = close_expired_listings(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Closed {closed} expired listing(s)."))
+            return
+
+        self.stdout.write(f"Closing expired listings every "
+                          f"{options['interval']}s, Ctrl-C to stop.")
+        try:
+            while True:
+                close_old_connections()
+                started = time.perf_counter()
+                closed = close_expired_listings(
+                    batch_size=options["batch_size"])
+                if closed:
+                    self.stdout.write(
+                        f"Closed {closed} expired listing(s) in "
+                        f"{time.perf_counter() - started:.3f}s.")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from auctions.stats import rebuild_bid_stats, rebuild_category_counts
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the denormalized price and bid-count columns of every "
+            "listing from the Bid table, and the active listing counts of "
+            "the categories.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_bid_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt bid stats for {updated} listing(s)."))
+        updated = rebuild_category_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt active listing counts for {updated} category(ies)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from auctions import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of listing titles and descriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        indexed = search.rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} listing(s) with the {backend.name} backend."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from auctions.stats import rebuild_user_summaries
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the \"My listings\" summary of every user from the "
+            "listings and bids.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_user_summaries(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the summaries of {updated} user(s)."))
@@ -0,0 +1,182 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from auctions import search
+from auctions.stats import rebuild_category_counts, rebuild_user_summaries
+from auctions.models import User, Category, Listing, Bid, Comment
+
+WORDS = (
+    "vintage antique modern classic rare signed boxed mint used new red blue "
+    "green black white wooden leather silver golden ceramic glass bicycle "
+    "camera guitar lamp chair table watch clock record book poster vase "
+    "jacket helmet radio console keyboard painting sculpture rug mirror"
+).split()
+
+CATEGORIES = (
+    "Antiques", "Art", "Books", "Clothing", "Collectibles", "Electronics",
+    "Home", "Music", "Sports", "Toys",
+)
+
+# All seeded data is dated relative to this instant, so a given seed always
+# produces the same rows. Only the end of the running auctions is relative
+# to the time of seeding, so that they are still running.
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# Auction durations, in days, as offered by the listing form
+DURATIONS = (1, 3, 7, 14)
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with a deterministic, realistic auction dataset "
+            "for benchmarks. Every seeded user has the password 'password'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--categories", type=int, default=len(CATEGORIES))
+        parser.add_argument("--listings", type=int, default=1000)
+        parser.add_argument("--max-bids", type=int, default=20,
+                            help="Maximum number of bids per listing, on top of the initial one.")
+        parser.add_argument("--max-comments", type=int, default=5,
+                            help="Maximum number of comments per listing.")
+        parser.add_argument("--watches", type=int, default=10,
+                            help="Number of listings each user watches.")
+        parser.add_argument("--closed-ratio", type=float, default=0.2)
+        parser.add_argument("--overdue-ratio", type=float, default=0.05,
+                            help="Share of the active listings whose end has "
+                                 "passed, left for the scheduler to close.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--skip-search-index", action="store_true")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+
+        with transaction.atomic():
+            users = self.create_users(options["seed"], options["users"],
+                                      batch_size)
+            categories = self.create_categories(options["categories"])
+            listing_ids = []
+            remaining = options["listings"]
+            while remaining > 0:
+                count = min(batch_size, remaining)
+                listing_ids += self.create_listing_batch(
+                    rng, users, categories, count, now, options)
+                remaining -= count
+            self.create_watches(rng, users, listing_ids, options["watches"],
+                                batch_size)
+            # bulk_create skips the signals that keep the counts
+            rebuild_category_counts()
+            rebuild_user_summaries(batch_size=batch_size)
+
+        if not options["skip_search_index"]:
+            search.rebuild_index(batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(categories)} categories and "
+            f"{len(listing_ids)} listings in "
+            f"{time.perf_counter() - started:.1f}s."))
+
+    def create_users(self, seed, count, batch_size):
+        # Users left by an earlier run with the same seed are reused
+        names = [f"seed{seed}-user{i}" for i in range(count)]
+        password = make_password("password")
+        User.objects.bulk_create([
+            User(username=name, password=password, email=f"{name}@example.com")
+            for name in names
+        ], batch_size=batch_size, ignore_conflicts=True)
+        existing = {user.username: user for user in User.objects.filter(
+            username__startswith=f"seed{seed}-user")}
+        return [existing[name] for name in names]
+
+    def create_categories(self, count):
+        titles = [CATEGORIES[i] if i < len(CATEGORIES) else f"Category {i}"
+                  for i in range(count)]
+        existing = {category.title: category
+                    for category in Category.objects.filter(title__in=titles)}
+        Category.objects.bulk_create([Category(title=title) for title in titles
+                                      if title not in existing])
+        return list(Category.objects.filter(title__in=titles))
+
+    def create_listing_batch(self, rng, users, categories, count, now,
+                             options):
+        listings = []
+        bids = []
+        for _ in range(count):
+            author = rng.choice(users)
+            created_at = EPOCH + timedelta(seconds=rng.randrange(90 * 24 * 3600))
+            duration = timedelta(days=rng.choice(DURATIONS))
+            listing = Listing(
+                author=author,
+                category=rng.choice(categories),
+                created_at=created_at,
+                title=" ".join(rng.sample(WORDS, 3)).capitalize(),
+                description=" ".join(rng.choices(WORDS, k=rng.randint(8, 30))),
+                img_url=f"https://example.com/images/{rng.randrange(10 ** 6)}.jpg",
+                active=rng.random() >= options["closed_ratio"],
+            )
+            # Initial bid by the author, then strictly increasing bids by
+            # other users spread over the auction's duration
+            start_price = price = round(rng.uniform(1, 500), 2)
+            max_gap = max(2, int(duration.total_seconds())
+                          // (options["max_bids"] + 1))
+            listing_bids = [(author, price, created_at)]
+            at = created_at
+            for _ in range(rng.randint(0, options["max_bids"])):
+                bidder = rng.choice(users)
+                if bidder == author:
+                    continue
+                # Additive steps keep long bidding wars at plausible prices
+                price = round(price + rng.uniform(0.5, 1 + start_price / 20), 2)
+                at += timedelta(seconds=rng.randrange(1, max_gap))
+                listing_bids.append((bidder, price, at))
+            top_bidder, top_price, _ = listing_bids[-1]
+            listing.current_bid_amount = Decimal(str(top_price))
+            listing.current_bidder = top_bidder
+            listing.bid_count = len(listing_bids)
+            if not listing.active:
+                # Closed when it ended, after its last bid
+                listing.ends_at = listing.closed_at = created_at + duration
+                if top_bidder != author:
+                    listing.winner = top_bidder
+            elif rng.random() < options["overdue_ratio"]:
+                listing.ends_at = now - timedelta(
+                    seconds=rng.randrange(1, 24 * 3600))
+            else:
+                listing.ends_at = now + timedelta(
+                    seconds=rng.randrange(60, int(duration.total_seconds())))
+            listings.append(listing)
+            bids.append(listing_bids)
+
+        Listing.objects.bulk_create(listings)
+        Bid.objects.bulk_create([
+            Bid(user=user, listing=listing, ammount=Decimal(str(amount)),
+                created_at=at)
+            for listing, listing_bids in zip(listings, bids)
+            for user, amount, at in listing_bids
+        ])
+        Comment.objects.bulk_create([
+            Comment(author=rng.choice(users), listing=listing,
+                    body=" ".join(rng.choices(WORDS, k=rng.randint(3, 20))),
+                    created_at=listing.created_at + timedelta(
+                        seconds=rng.randrange(7 * 24 * 3600)))
+            for listing in listings
+            for _ in range(rng.randint(0, options["max_comments"]))
+        ])
+        return [listing.id for listing in listings]
+
+    def create_watches(self, rng, users, listing_ids, watches, batch_size):
+        Watch = User.watchlist.through
+        Watch.objects.bulk_create([
+            Watch(user_id=user.id, listing_id=listing_id)
+            for user in users
+            for listing_id in rng.sample(listing_ids, min(watches, len(listing_ids)))
+        ], batch_size=batch_size)
@@ -0,0 +1,48 @@
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from auctions import digests
+
+
+class Command(BaseCommand):
+    help = ("Build the digest of every user (outbid, closing soon, won) in "
+            "one streaming pass, write them to the digest sink and report "
+            "throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24,
+                            help="Period covered by the digests.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--sink",
+                            help="Sink class, default AUCTIONS_DIGEST_SINK.")
+        parser.add_argument("--output",
+                            help="File written by a file sink.")
+        parser.add_argument("--trace-memory", action="store_true",
+                            help="Also report the peak Python memory.")
+
+    def handle(self, *args, **options):
+        kwargs = {"path": options["output"]} if options["output"] else {}
+        sink = digests.get_sink(options["sink"], **kwargs)
+        stats = digests.DigestStats()
+        if options["trace_memory"]:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            for digest in digests.build_digests(
+                    period=timedelta(hours=options["hours"]),
+                    chunk_size=options["chunk_size"], stats=stats):
+                sink.write(digest)
+        finally:
+            sink.close()
+        seconds = max(time.perf_counter() - started, 1e-9)
+        self.stderr.write(
+            f"Wrote {stats.digests} digest(s) from {stats.rows} row(s) in "
+            f"{seconds:.2f}s: {stats.rows / seconds:.0f} rows/s, "
+            f"{stats.digests / seconds:.0f} digests/s.")
+        if options["trace_memory"]:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stderr.write(f"Peak memory {peak / 1024 / 1024:.1f} MiB.")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from auctions import routing
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database into each read replica of "
+            "AUCTIONS_DB_REPLICAS, for running replicas locally. Other "
+            "databases replicate on their own.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=float, metavar="SECONDS",
+                            help="Keep copying, this many seconds apart.")
+
+    def handle(self, *args, **options):
+        aliases = routing.replicas()
+        if not aliases:
+            raise CommandError("AUCTIONS_DB_REPLICAS is empty.")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias!r} is not a SQLite database.")
+
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                self.copy(alias)
+                self.stdout.write(
+                    f"{alias}: copied in "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms")
+            if options["loop"] is None:
+                break
+            time.sleep(options["loop"])
+
+    def copy(self, alias):
+        primary = connections[DEFAULT_DB_ALIAS]
+        replica = connections[alias]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        # The online backup API copies a consistent snapshot page by page
+        primary.connection.backup(replica.connection)
@@ -0,0 +1,165 @@
+"""In-process request metrics.
+
+`PerformanceMiddleware` (auctions.middleware) measures a sample of the
+requests and feeds `record_request`, which logs one structured line per
+request to the "auctions.metrics" logger and folds the values into
+per-URL-name histograms. Staff can read the histograms at /metrics/.
+
+Histograms use fixed buckets, so recording is a lock and a few integer
+increments and memory stays constant however long the process runs.
+Each worker process keeps its own numbers.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger("auctions.metrics")
+
+TIME_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Metrics of the request being measured in the current thread or task
+current_request = contextvars.ContextVar("auctions_request_metrics",
+                                         default=None)
+
+
+@dataclass
+class RequestMetrics:
+    view: str = ""
+    status: int = 0
+    wall_ms: float = 0.0
+    sql_count: int = 0
+    sql_ms: float = 0.0
+    template_ms: float = 0.0
+    response_bytes: int = 0
+
+
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last bucket holds everything above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the `pct` percentile."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": dict(zip([str(bound) for bound in self.bounds] + ["inf"],
+                                self.counts)),
+        }
+
+
+class ViewMetrics:
+
+    def __init__(self):
+        self.wall_ms = Histogram(TIME_BUCKETS_MS)
+        self.sql_count = Histogram(COUNT_BUCKETS)
+        self.sql_ms = Histogram(TIME_BUCKETS_MS)
+        self.template_ms = Histogram(TIME_BUCKETS_MS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+
+    def add(self, metrics):
+        self.wall_ms.add(metrics.wall_ms)
+        self.sql_count.add(metrics.sql_count)
+        self.sql_ms.add(metrics.sql_ms)
+        self.template_ms.add(metrics.template_ms)
+        self.response_bytes.add(metrics.response_bytes)
+
+    def snapshot(self):
+        return {name: histogram.snapshot()
+                for name, histogram in vars(self).items()}
+
+
+_views = {}
+_lock = threading.Lock()
+
+
+def record_request(metrics):
+    logger.info(json.dumps(asdict(metrics)))
+    with _lock:
+        if metrics.view not in _views:
+            _views[metrics.view] = ViewMetrics()
+        _views[metrics.view].add(metrics)
+
+
+def snapshot():
+    with _lock:
+        return {view: view_metrics.snapshot()
+                for view, view_metrics in sorted(_views.items())}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+class SQLTimer:
+    """Database execute wrapper adding each query's time to the current request."""
+
+    def __call__(self, execute, sql, params, many, context):
+        metrics = current_request.get()
+        if metrics is None:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.sql_count += 1
+            metrics.sql_ms += (time.perf_counter() - started) * 1000
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = current_request.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that times renders for the metrics middleware."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
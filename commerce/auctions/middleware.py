@@ -0,0 +1,242 @@
+import random
+import time
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, csrf, security
+
+from . import metrics, ratelimit, routing
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class SyncAndAsyncMiddleware:
+    """Base of the middleware that runs natively under both WSGI and ASGI.
+
+    Under ASGI a sync-only middleware would push every request, async
+    views included, through a thread. Subclasses implement `before()`,
+    whose result is passed to `after()` and then `reset()`, which runs
+    even if the view raised.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.before(request)
+        try:
+            return self.after(request, self.get_response(request), state)
+        finally:
+            self.reset(state)
+
+    async def __acall__(self, request):
+        state = self.before(request)
+        try:
+            return self.after(request, await self.get_response(request), state)
+        finally:
+            self.reset(state)
+
+    def before(self, request):
+        return None
+
+    def reset(self, state):
+        pass
+
+    def after(self, request, response, state):
+        return response
+
+
+class PerformanceMiddleware(SyncAndAsyncMiddleware):
+    """Measure wall time, SQL, template rendering and response size per view.
+
+    Only a sample of the requests is measured, set by
+    AUCTIONS_METRICS_SAMPLE_RATE (0 to 1); the others pay for a single
+    random() call. Queries are timed by the metrics.SQLTimer installed on
+    every connection, which also sees those async views run in threads.
+    """
+
+    def before(self, request):
+        if random.random() >= settings.AUCTIONS_METRICS_SAMPLE_RATE:
+            return None
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        return request_metrics, token, time.perf_counter()
+
+    def reset(self, state):
+        if state is not None:
+            metrics.current_request.reset(state[1])
+
+    def after(self, request, response, state):
+        if state is None:
+            return response
+        request_metrics, _, started = state
+        request_metrics.wall_ms = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        request_metrics.view = (match.view_name if match is not None
+                                else "<unresolved>")
+        request_metrics.status = response.status_code
+        if not response.streaming:
+            request_metrics.response_bytes = len(response.content)
+        metrics.record_request(request_metrics)
+        return response
+
+
+class ReplicaRoutingMiddleware(SyncAndAsyncMiddleware):
+    """Pin a client's reads to the primary database after it writes.
+
+    Unsafe requests read from the primary, and so do the requests of a
+    client during the AUCTIONS_DB_REPLICA_LAG seconds after it wrote,
+    which a short-lived cookie marks. Does nothing without replicas.
+    """
+
+    cookie_name = "auctions_primary"
+
+    def before(self, request):
+        if not routing.replicas():
+            return None
+        unsafe = request.method not in SAFE_METHODS
+        primary_token = routing.use_primary.set(
+            unsafe or self.cookie_name in request.COOKIES)
+        wrote_token = routing.wrote.set(False)
+        return unsafe, primary_token, wrote_token
+
+    def reset(self, state):
+        if state is not None:
+            _, primary_token, wrote_token = state
+            routing.use_primary.reset(primary_token)
+            routing.wrote.reset(wrote_token)
+
+    def after(self, request, response, state):
+        if state is None:
+            return response
+        unsafe = state[0]
+        if unsafe or routing.wrote.get():
+            response.set_cookie(self.cookie_name, "1",
+                                max_age=settings.AUCTIONS_DB_REPLICA_LAG,
+                                httponly=True, samesite="Lax")
+        return response
+
+
+class RateLimitMiddleware(SyncAndAsyncMiddleware):
+    """Hold every unsafe request to the "write" rate limit of its client.
+
+    Must come after AuthenticationMiddleware, as logged-in users are
+    limited by account rather than by IP address.
+    """
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS:
+            response = ratelimit.check(request, "write")
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in SAFE_METHODS:
+            response = await ratelimit.acheck(request, "write")
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+
+class InlineHooksMixin:
+    """Call the hooks of a stock Django middleware on the event loop.
+
+    Under ASGI, MiddlewareMixin runs process_request(), process_view() and
+    process_response() through sync_to_async(): with the stock middleware,
+    a dozen round trips a request to the request's thread, each waiting
+    for the loop to get the GIL back, which made the async pages slower
+    under ASGI than under WSGI. On GET, HEAD and OPTIONS requests the hooks
+    of the middleware below only read headers and cookies and set
+    attributes, so they are called directly; a response is still sent
+    through the thread when `needs_thread()` says its hook would query the
+    database. Other requests keep the thread for every hook: CSRF checks
+    read request.POST, whose body may be spooled to disk.
+    """
+
+    inline_methods = frozenset({"GET", "HEAD", "OPTIONS"})
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.async_mode and hasattr(self, "process_view"):
+            # The handler calls process_view() through a thread unless it
+            # is a coroutine function
+            process_view = self.process_view
+
+            async def aprocess_view(request, *args):
+                return await self._call_hook(process_view, request,
+                                             request, *args)
+
+            self.process_view = aprocess_view
+
+    async def _call_hook(self, hook, request, *args, in_thread=False):
+        if in_thread or request.method not in self.inline_methods:
+            return await sync_to_async(hook, thread_sensitive=True)(*args)
+        return hook(*args)
+
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, "process_request"):
+            response = await self._call_hook(self.process_request, request,
+                                             request)
+        response = response or await self.get_response(request)
+        if hasattr(self, "process_response"):
+            response = await self._call_hook(
+                self.process_response, request, request, response,
+                in_thread=self.needs_thread(request, response))
+        return response
+
+    def needs_thread(self, request, response):
+        return False
+
+
+class SecurityMiddleware(InlineHooksMixin, security.SecurityMiddleware):
+    pass
+
+
+class SessionMiddleware(InlineHooksMixin, sessions.SessionMiddleware):
+
+    def needs_thread(self, request, response):
+        # The session is saved, and its expiry read, only when it changed
+        session = getattr(request, "session", None)
+        return session is not None and (
+            session.modified or settings.SESSION_SAVE_EVERY_REQUEST)
+
+
+class CommonMiddleware(InlineHooksMixin, common.CommonMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(InlineHooksMixin, csrf.CsrfViewMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(InlineHooksMixin,
+                               auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(InlineHooksMixin, messages.MessageMiddleware):
+
+    def needs_thread(self, request, response):
+        # Messages that overflow the cookie are stored in the session
+        storage = getattr(request, "_messages", None)
+        return storage is not None and (storage.used or storage.added_new)
+
+
+class XFrameOptionsMiddleware(InlineHooksMixin,
+                              clickjacking.XFrameOptionsMiddleware):
+    pass
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    top_bids = Bid.objects.filter(
+        listing=OuterRef('pk')).order_by('-ammount', 'created_at', 'id')
+    bid_counts = Bid.objects.filter(listing=OuterRef('pk')).order_by().values(
+        'listing').annotate(total=Count('id')).values('total')
+    Listing.objects.update(
+        current_bid_amount=Coalesce(
+            Subquery(top_bids.values('ammount')[:1]), Value(0.0)),
+        current_bidder=Subquery(top_bids.values('user')[:1]),
+        bid_count=Coalesce(
+            Subquery(bid_counts, output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0004_alter_user_watchlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_bid_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(populate_bid_stats, migrations.RunPython.noop),
+    ]
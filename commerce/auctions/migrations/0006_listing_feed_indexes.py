@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0005_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['active', '-created_at', '-id'], name='listing_active_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', 'active', '-created_at', '-id'], name='listing_category_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_winners(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.filter(active=False).exclude(
+        current_bidder=F('author')).update(winner=F('current_bidder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_listing_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(populate_winners, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 is optional: without it auctions.search falls back to the
+    # SearchPosting inverted index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE auctions_listing_fts '
+            'USING fts5(title, description)')
+    except OperationalError:
+        return
+    schema_editor.execute(
+        'INSERT INTO auctions_listing_fts (rowid, title, description) '
+        'SELECT id, title, description FROM auctions_listing')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS auctions_listing_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_listing_winner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'listing'), name='searchposting_term_listing_uniq')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
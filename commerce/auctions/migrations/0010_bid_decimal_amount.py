@@ -0,0 +1,26 @@
+# Switches bid amounts from FloatField to DecimalField without one long
+# table rewrite: this migration adds a nullable decimal column (a cheap
+# ADD COLUMN), 0011 copies the amounts over in small transactions, and
+# 0012 catches up on stragglers and swaps the columns.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='ammount_decimal',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='listing',
+            name='current_bid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
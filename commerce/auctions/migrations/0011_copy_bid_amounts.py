@@ -0,0 +1,39 @@
+from django.db import migrations, models, transaction
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+BATCH_SIZE = 5000
+
+
+def copy_bid_amounts(apps, schema_editor):
+    """Copy `ammount` into `ammount_decimal`, one short transaction per batch."""
+    Bid = apps.get_model('auctions', 'Bid')
+    db_alias = schema_editor.connection.alias
+    bids = Bid.objects.using(db_alias)
+    last_pk = 0
+    while True:
+        batch = list(bids.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            return
+        with transaction.atomic(using=db_alias):
+            bids.filter(pk__gte=batch[0], pk__lte=batch[-1],
+                        ammount_decimal__isnull=True).update(
+                ammount_decimal=Round(Cast(
+                    F('ammount'),
+                    models.DecimalField(max_digits=12, decimal_places=2)), 2))
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Every batch commits on its own so writers are only held up briefly
+    atomic = False
+
+    dependencies = [
+        ('auctions', '0010_bid_decimal_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_bid_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Catch up on bids placed since 0011 ran, before dropping the float column
+copy_bid_amounts = import_module(
+    'auctions.migrations.0011_copy_bid_amounts').copy_bid_amounts
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_copy_bid_amounts'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_bid_amounts, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='bid',
+            name='ammount',
+        ),
+        migrations.RenameField(
+            model_name='bid',
+            old_name='ammount_decimal',
+            new_name='ammount',
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='ammount',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-ammount'], name='bid_listing_top_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_active_counts(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    active = Listing.objects.filter(
+        category=OuterRef('pk'), active=True).order_by().values(
+        'category').annotate(total=Count('id')).values('total')
+    Category.objects.update(active_listing_count=Coalesce(
+        Subquery(active, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_bid_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_listing_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_active_counts, migrations.RunPython.noop),
+    ]
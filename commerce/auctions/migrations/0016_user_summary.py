@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import (Count, DecimalField, IntegerField, OuterRef,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+
+
+def populate_summaries(apps, schema_editor):
+    User = apps.get_model('auctions', 'User')
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    UserSummary = apps.get_model('auctions', 'UserSummary')
+    UserSummary.objects.bulk_create(
+        [UserSummary(user_id=pk) for pk in User.objects.values_list('pk', flat=True)],
+        batch_size=1000)
+
+    def total(queryset, aggregate, output_field, zero):
+        return Coalesce(Subquery(queryset.annotate(total=aggregate).values('total'),
+                                 output_field=output_field), Value(zero))
+
+    authored = Listing.objects.filter(author=OuterRef('user')).order_by().values('author')
+    received = Bid.objects.filter(listing__author=OuterRef('user')).exclude(
+        user=OuterRef('user')).order_by().values('listing__author')
+    won = Listing.objects.filter(winner=OuterRef('user'), active=False).order_by().values('winner')
+    UserSummary.objects.update(
+        active_listings=total(authored.filter(active=True), Count('id'), IntegerField(), 0),
+        closed_listings=total(authored.filter(active=False), Count('id'), IntegerField(), 0),
+        bids_received=total(received, Count('id'), IntegerField(), 0),
+        gross_sales=total(authored.filter(active=False, winner__isnull=False),
+                          Sum('current_bid_amount'),
+                          DecimalField(max_digits=14, decimal_places=2), Decimal(0)),
+        auctions_won=total(won, Count('id'), IntegerField(), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_comment_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('active_listings', models.PositiveIntegerField(default=0)),
+                ('closed_listings', models.PositiveIntegerField(default=0)),
+                ('bids_received', models.PositiveIntegerField(default=0)),
+                ('gross_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('auctions_won', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['author', 'active', '-created_at', '-id'], name='listing_author_feed_idx'),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:03
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_closed_at(apps, schema_editor):
+    # Listings that closed once their end time passed closed about then;
+    # when the others were closed early is not known
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.filter(active=False, ends_at__lte=timezone.now()).update(
+        closed_at=models.F('ends_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_user_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_closed_at, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
+from collections import Counter
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent with the `listing_ids` closed by ListingQuerySet.close(), which
+# bypasses post_save, and how many of them each category lost in
+# `category_counts`
+listings_closed = Signal()
 
 
 class User(AbstractUser):
@@ -15,36 +24,166 @@ class User(AbstractUser):
 
 class Category(models.Model):
     title = models.CharField(max_length=64)
+    # Denormalized, kept in sync by auctions.signals as listings open and
+    # close and rebuilt by `rebuild_listing_stats`
+    active_listing_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.title}"
 
 
+class ListingQuerySet(models.QuerySet):
+
+    def expired(self, now):
+        """Active listings whose end time has passed."""
+        return self.filter(active=True, ends_at__lte=now)
+
+    def close(self):
+        """Close the active listings of the queryset and record their winners.
+
+        The winner is the current bidder, unless that is still the author
+        (only the initial bid was placed). Done in one UPDATE so a bid
+        can't slip in between reading the top bidder and closing.
+
+        `listings_closed` gets only the listings this call closed. If a
+        concurrent close (the scheduler and the author, say) took some of
+        those read here, that UPDATE is undone and they are closed one by
+        one instead, each UPDATE telling whether this call closed it.
+        """
+        rows = dict(self.filter(active=True).values_list("pk", "category_id"))
+        if not rows:
+            return 0
+        now = timezone.now()
+        with transaction.atomic():
+            savepoint = transaction.savepoint()
+            if _close_listings(now, pk__in=rows) == len(rows):
+                transaction.savepoint_commit(savepoint)
+                listing_ids = list(rows)
+            else:
+                transaction.savepoint_rollback(savepoint)
+                listing_ids = [pk for pk in rows
+                               if _close_listings(now, pk=pk)]
+            if listing_ids:
+                listings_closed.send(
+                    sender=Listing, listing_ids=listing_ids,
+                    category_counts=Counter(rows[pk] for pk in listing_ids))
+        return len(listing_ids)
+
+
+def _close_listings(now, **lookups):
+    """Close the active listings matching `lookups` at `now`; return how many."""
+    return Listing.objects.filter(active=True, **lookups).update(
+        active=False,
+        closed_at=now,
+        winner=models.Case(
+            models.When(current_bidder=models.F("author"),
+                        then=models.Value(None)),
+            default=models.F("current_bidder"),
+            output_field=models.IntegerField()),
+    )
+
+
 class Listing(models.Model):
     active = models.BooleanField(default=True)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE)
     created_at = models.DateTimeField()
+    # Closed automatically by auctions.scheduler once passed; listings
+    # without one stay open until their author closes them
+    ends_at = models.DateTimeField(null=True, blank=True)
     title = models.CharField(max_length=64)
     description = models.TextField(max_length=300)
     img_url = models.CharField(max_length=200)
     category = models.ForeignKey(Category,
                                  blank=True,
                                  on_delete=models.CASCADE)
+    # Denormalized bid data, kept in sync by auctions.signals on every
+    # new Bid and rebuilt from the Bid table by `rebuild_listing_stats`
+    current_bid_amount = models.DecimalField(max_digits=12,
+                                             decimal_places=2,
+                                             default=0)
+    current_bidder = models.ForeignKey(User,
+                                       null=True,
+                                       blank=True,
+                                       on_delete=models.SET_NULL,
+                                       related_name="leading_listings")
+    bid_count = models.PositiveIntegerField(default=0)
+    # Set when the listing is closed
+    winner = models.ForeignKey(User,
+                               null=True,
+                               blank=True,
+                               on_delete=models.SET_NULL,
+                               related_name="won_listings")
+    # When it was closed, early by its author or once `ends_at` passed;
+    # unknown for listings closed before this was recorded
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the index and category feeds
+            models.Index(fields=["active", "-created_at", "-id"],
+                         name="listing_active_feed_idx"),
+            models.Index(fields=["category", "active", "-created_at", "-id"],
+                         name="listing_category_feed_idx"),
+            # Pages of a seller's own listings on "My listings"
+            models.Index(fields=["author", "active", "-created_at", "-id"],
+                         name="listing_author_feed_idx"),
+            # Expiry scans, covering open listings only
+            models.Index(fields=["ends_at"],
+                         condition=models.Q(active=True),
+                         name="listing_open_ends_at_idx"),
+        ]
 
     def __str__(self):
         return f"{'ACTIVE' if self.active else 'INACTIVE'} | {self.title} ({self.author})"
 
 
+class UserSummary(models.Model):
+    """Totals of the "My listings" page of a user.
+
+    Kept up to date by auctions.signals as listings are created and closed
+    and bids come in, and rebuilt by `rebuild_user_summaries`.
+    """
+    user = models.OneToOneField(User,
+                                primary_key=True,
+                                on_delete=models.CASCADE,
+                                related_name="summary")
+    active_listings = models.PositiveIntegerField(default=0)
+    closed_listings = models.PositiveIntegerField(default=0)
+    # Bids of other users on the user's listings
+    bids_received = models.PositiveIntegerField(default=0)
+    # Final prices of the user's closed listings that found a winner
+    gross_sales = models.DecimalField(max_digits=14,
+                                      decimal_places=2,
+                                      default=0)
+    auctions_won = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Summary of {self.user}"
+
+
 class Bid(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE)
     listing = models.ForeignKey(Listing,
                                 on_delete=models.CASCADE,
                                 related_name="bids")
-    ammount = models.FloatField()
+    ammount = models.DecimalField(max_digits=12,
+                                  decimal_places=2)
     created_at = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # Makes the top bid of a listing an index seek
+            models.Index(fields=["listing", "-ammount"],
+                         name="bid_listing_top_idx"),
+            # Price history, paginated in time order
+            models.Index(fields=["listing", "created_at", "id"],
+                         name="bid_listing_time_idx"),
+        ]
+
     def __str__(self):
         return f"{self.listing} -> ${self.ammount} ({self.user})"
 
@@ -58,5 +197,30 @@ class Comment(models.Model):
     body = models.TextField(max_length=300)
     created_at = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a listing's comments, newest first
+            models.Index(fields=["listing", "-created_at", "-id"],
+                         name="comment_listing_time_idx"),
+        ]
+
     def __str__(self):
         return f"{self.listing} - {self.author} ({self.created_at})"
+
+
+class SearchPosting(models.Model):
+    """A (term, listing) entry of the fallback full-text index, see auctions.search."""
+    term = models.CharField(max_length=64)
+    listing = models.ForeignKey(Listing,
+                                on_delete=models.CASCADE,
+                                related_name="+")
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["term", "listing"],
+                                    name="searchposting_term_listing_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.listing_id} ({self.weight})"
@@ -0,0 +1,166 @@
+"""Token-bucket rate limits on the actions that write.
+
+Every client, a logged-in user or else an IP address, gets a bucket per
+action holding up to `burst` tokens, refilled at `burst` tokens per
+`period` seconds; each request takes one, and a request finding the
+bucket empty gets 429 Too Many Requests with the seconds until the next
+token in Retry-After. Limits are set per action in AUCTIONS_RATE_LIMITS
+as {action: (burst, period)}; actions left out are not limited.
+
+Views are limited with the `rate_limit` decorator, and
+auctions.middleware.RateLimitMiddleware holds every unsafe request to
+the "write" limit, so no client can monopolise the database writer.
+
+Buckets live in the backend named in AUCTIONS_RATE_LIMIT_BACKEND: in
+this process's memory, or in the Django cache to share them between
+workers. The cache backend reads and writes a bucket without a lock, so
+concurrent requests of one client may overdraw it by a token or two.
+"""
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from . import caching
+
+
+def _take(bucket, burst, period, now):
+    """Return the bucket after taking a token, and the seconds to wait
+    (0 if a token was taken)."""
+    rate = burst / period
+    tokens, updated = bucket if bucket is not None else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalMemoryBackend:
+    """Buckets of this process, the `max_buckets` most recently used."""
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, period):
+        with self._lock:
+            bucket, wait = _take(self._buckets.get(key), burst, period,
+                                 time.monotonic())
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_buckets:
+                # Least recently used, and most likely full again
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def atake(self, key, burst, period):
+        # Memory only, no reason to leave the event loop
+        return self.take(key, burst, period)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBackend:
+    """Buckets in the AUCTIONS_CACHE_ALIAS cache, shared by every worker."""
+
+    def _cache_key(self, key):
+        return f"auctions:ratelimit:{key}"
+
+    def take(self, key, burst, period):
+        cache = caches[settings.AUCTIONS_CACHE_ALIAS]
+        bucket, wait = _take(cache.get(self._cache_key(key)), burst, period,
+                             time.time())
+        # A bucket untouched for a whole period is full again anyway
+        cache.set(self._cache_key(key), bucket, math.ceil(period))
+        return wait
+
+    async def atake(self, key, burst, period):
+        cache = caching.aget_cache()
+        bucket, wait = _take(await cache.aget(self._cache_key(key)), burst,
+                             period, time.time())
+        await cache.aset(self._cache_key(key), bucket, math.ceil(period))
+        return wait
+
+
+@functools.cache
+def _backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _backend(settings.AUCTIONS_RATE_LIMIT_BACKEND)
+
+
+def _client(request, user):
+    if user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _too_many(wait):
+    response = HttpResponse("Too many requests, please slow down.",
+                            status=429)
+    response["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def check(request, action):
+    """Take a token of `action` for the client; return a 429 response if
+    there was none, else None."""
+    limit = settings.AUCTIONS_RATE_LIMITS.get(action)
+    if limit is None:
+        return None
+    wait = get_backend().take(f"{action}:{_client(request, request.user)}",
+                              *limit)
+    return _too_many(wait) if wait else None
+
+
+async def acheck(request, action):
+    limit = settings.AUCTIONS_RATE_LIMITS.get(action)
+    if limit is None:
+        return None
+    user = await request.auser()
+    wait = await get_backend().atake(f"{action}:{_client(request, user)}",
+                                     *limit)
+    return _too_many(wait) if wait else None
+
+
+def rate_limit(action):
+    """Limit a view to the AUCTIONS_RATE_LIMITS of `action`.
+
+    `action` is an action name, or a function of the request returning
+    one, or None for requests that aren't limited.
+    """
+    get_action = action if callable(action) else lambda request: action
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def inner(request, *args, **kwargs):
+                name = get_action(request)
+                if name is not None:
+                    response = await acheck(request, name)
+                    if response is not None:
+                        return response
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def inner(request, *args, **kwargs):
+                name = get_action(request)
+                if name is not None:
+                    response = check(request, name)
+                    if response is not None:
+                        return response
+                return view(request, *args, **kwargs)
+        return inner
+    return decorator
@@ -0,0 +1,46 @@
+"""Route reads to the read replicas and writes to the primary database.
+
+The replica aliases are listed in AUCTIONS_DB_REPLICAS; with none, every
+query goes to the default database. Reads stay on the primary for the
+rest of the request once it writes, inside transactions, and for a short
+while after a client's write (see ReplicaRoutingMiddleware), so users
+always see their own bids and comments.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Whether reads must go to the primary in the current request or task, and
+# whether it wrote to the primary
+use_primary = contextvars.ContextVar("auctions_use_primary", default=False)
+wrote = contextvars.ContextVar("auctions_wrote", default=False)
+
+
+def replicas():
+    return settings.AUCTIONS_DB_REPLICAS
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if (not aliases or use_primary.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request
+        use_primary.set(True)
+        wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated on their own
+        return db not in replicas()
@@ -0,0 +1,25 @@
+"""Closing of listings whose `ends_at` has passed.
+
+`close_expired_listings` pages through the expired listings by end time
+on the partial `listing_open_ends_at_idx` index, so every pass touches
+only the listings that are due, however many auctions are open. Each
+batch is closed with ListingQuerySet.close(), which records the winners
+and sends `listings_closed` for the close events.
+"""
+from django.utils import timezone
+
+from .models import Listing
+
+
+def close_expired_listings(now=None, batch_size=500):
+    """Close every listing that ended by `now`. Returns the number closed."""
+    if now is None:
+        now = timezone.now()
+    closed = 0
+    while True:
+        listing_ids = list(Listing.objects.expired(now).order_by(
+            "ends_at").values_list("pk", flat=True)[:batch_size])
+        if not listing_ids:
+            return closed
+        closed += Listing.objects.filter(pk__in=listing_ids).close()
+
@@ -0,0 +1,215 @@
+"""Full-text search over listing titles and descriptions.
+
+Two interchangeable backends keep the index up to date as listings are
+saved (see auctions.signals) and answer ranked queries:
+
+* `Fts5Backend` uses an SQLite FTS5 virtual table, created by migration
+  0008 when the SQLite build supports it, and ranks with bm25, or by
+  recency when a query word is too common for that (see
+  AUCTIONS_SEARCH_RANKED_MATCHES).
+* `InvertedIndexBackend` keeps (term, listing, weight) postings in the
+  SearchPosting table and ranks by tf-idf. It works on any database.
+
+`AUCTIONS_SEARCH_BACKEND` picks one explicitly ("fts5" or "inverted");
+by default FTS5 is used whenever its table exists.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from .models import Listing, SearchPosting
+
+FTS_TABLE = "auctions_listing_fts"
+
+# Title words count more than description words
+TITLE_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Pages of newest matches ranked for a query too broad for bm25
+BROAD_QUERY_WINDOW = 10
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if len(token) <= SearchPosting._meta.get_field("term").max_length]
+
+
+def _filtered_listings(category=None, active=True):
+    listings = Listing.objects.all()
+    if active is not None:
+        listings = listings.filter(active=active)
+    if category is not None:
+        listings = listings.filter(category=category)
+    return listings
+
+
+class Fts5Backend:
+    name = "fts5"
+
+    def index(self, listing):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                           [listing.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+                "VALUES (%s, %s, %s)",
+                [listing.pk, listing.title, listing.description])
+
+    def remove(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                           [listing_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search_ids(self, terms, category=None, active=True, limit=20):
+        # Quote every term so user input can't inject FTS5 query syntax
+        match = " ".join(f'"{term}"' for term in terms)
+        most = settings.AUCTIONS_SEARCH_RANKED_MATCHES
+        if all(self._holders(term, most + 1) <= most for term in terms):
+            rows = self._matches(match, category, active, limit,
+                                 order=f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, "
+                                       f"{DESCRIPTION_WEIGHT}), f.rowid DESC")
+            return [pk for pk, _ in rows]
+        # bm25 weighs each term by the number of listings holding it, which
+        # it counts by reading all of them, and then scores every match: a
+        # second for a word in 40% of a million listings. Broad queries
+        # rank the newest matches instead, those with every word in the
+        # title first
+        rows = self._matches(match, category, active,
+                             limit * BROAD_QUERY_WINDOW)
+        wanted = set(terms)
+        rows.sort(key=lambda row: not wanted <= set(tokenize(row[1])))
+        return [pk for pk, _ in rows[:limit]]
+
+    def _holders(self, term, most):
+        """Return the number of listings holding `term`, up to `most`."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM (SELECT rowid FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s LIMIT %s)", [f'"{term}"', most])
+            return cursor.fetchone()[0]
+
+    def _matches(self, match, category, active, limit, order="f.rowid DESC"):
+        """Return the (id, title) of the listings matching `match`."""
+        sql = (f"SELECT f.rowid, l.title FROM {FTS_TABLE} f "
+               "JOIN auctions_listing l ON l.id = f.rowid "
+               f"WHERE {FTS_TABLE} MATCH %s")
+        params = [match]
+        if active is not None:
+            sql += " AND l.active = %s"
+            params.append(active)
+        if category is not None:
+            sql += " AND l.category_id = %s"
+            params.append(category)
+        sql += f" ORDER BY {order} LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class InvertedIndexBackend:
+    name = "inverted"
+
+    def index(self, listing):
+        weights = Counter()
+        for term in tokenize(listing.title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(listing.description):
+            weights[term] += DESCRIPTION_WEIGHT
+        self.remove(listing.pk)
+        SearchPosting.objects.bulk_create([
+            SearchPosting(term=term, listing_id=listing.pk, weight=weight)
+            for term, weight in weights.items()
+        ])
+
+    def remove(self, listing_id):
+        SearchPosting.objects.filter(listing_id=listing_id).delete()
+
+    def clear(self):
+        SearchPosting.objects.all().delete()
+
+    def search_ids(self, terms, category=None, active=True, limit=20):
+        # Inverse document frequency of every term, from the postings index.
+        # The highest listing id stands in for the listing count, which
+        # would need a full scan
+        total = Listing.objects.order_by("-pk").values_list(
+            "pk", flat=True).first() or 1
+        document_counts = dict(SearchPosting.objects.filter(
+            term__in=terms).values_list("term").annotate(Count("id")))
+        if len(document_counts) < len(terms):
+            # Some term matches nothing, so no listing has them all
+            return []
+        idf = {term: math.log(1 + total / count)
+               for term, count in document_counts.items()}
+        postings = SearchPosting.objects.filter(
+            term__in=terms,
+            listing__in=_filtered_listings(category, active))
+        return list(postings.values("listing").annotate(
+            matched=Count("term"),
+            score=Sum(Case(
+                *[When(term=term, then=F("weight") * Value(weight))
+                  for term, weight in idf.items()],
+                output_field=FloatField())),
+        ).filter(matched=len(terms)).order_by(
+            "-score", "-listing").values_list("listing", flat=True)[:limit])
+
+
+_fts5_tables = {}
+
+
+def get_backend():
+    choice = getattr(settings, "AUCTIONS_SEARCH_BACKEND", None)
+    if choice == "fts5":
+        return Fts5Backend()
+    if choice == "inverted":
+        return InvertedIndexBackend()
+    key = (connection.alias, connection.settings_dict["NAME"])
+    if key not in _fts5_tables:
+        _fts5_tables[key] = (connection.vendor == "sqlite" and FTS_TABLE
+                             in connection.introspection.table_names())
+    return Fts5Backend() if _fts5_tables[key] else InvertedIndexBackend()
+
+
+def index_listing(listing):
+    get_backend().index(listing)
+
+
+def remove_listing(listing_id):
+    get_backend().remove(listing_id)
+
+
+def rebuild_index(batch_size=1000):
+    """Re-index every listing, in primary-key batches. Returns the count."""
+    backend = get_backend()
+    backend.clear()
+    indexed = 0
+    last_pk = 0
+    while True:
+        listings = list(Listing.objects.filter(pk__gt=last_pk).order_by(
+            "pk").only("title", "description")[:batch_size])
+        if not listings:
+            return indexed
+        for listing in listings:
+            backend.index(listing)
+        indexed += len(listings)
+        last_pk = listings[-1].pk
+
+
+def search(query, category=None, active=True, limit=20):
+    """Return up to `limit` listings matching every word of `query`, best first."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    listing_ids = get_backend().search_ids(terms, category, active, limit)
+    listings = Listing.objects.select_related("author").in_bulk(listing_ids)
+    return [listings[pk] for pk in listing_ids if pk in listings]
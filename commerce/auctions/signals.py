@@ -0,0 +1,294 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import (Case, Count, DecimalField, F, IntegerField,
+                              OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, events, metrics, search
+from .models import (Bid, Category, Comment, Listing, User, UserSummary,
+                     listings_closed)
+
+
+@receiver(post_save, sender=Bid)
+def update_listing_bid_stats(sender, instance, created, raw=False, **kwargs):
+    """Fold a new bid into the denormalized columns of its listing.
+
+    Done as a single conditional UPDATE so concurrent bids can't lose
+    each other's increments. Only a strictly higher bid (or the first
+    one) takes over the current price, so ties keep the earlier bidder.
+    """
+    if not created or raw:
+        return
+    is_higher = (Q(current_bidder__isnull=True)
+                 | Q(current_bid_amount__lt=instance.ammount))
+    Listing.objects.filter(pk=instance.listing_id).update(
+        bid_count=F("bid_count") + 1,
+        current_bid_amount=Case(
+            When(is_higher, then=Value(instance.ammount)),
+            default=F("current_bid_amount"),
+            output_field=DecimalField(max_digits=12, decimal_places=2)),
+        current_bidder=Case(
+            When(is_higher, then=Value(instance.user_id)),
+            default=F("current_bidder"),
+            output_field=IntegerField()),
+    )
+
+
+def _less(field, amount):
+    # Decrements of the denormalized counts stop at zero, so a count that
+    # drifted (e.g. after bulk inserts) never blocks a close or a delete;
+    # the rebuild commands set them right
+    return Greatest(F(field) - amount, Value(0))
+
+
+# Active listing counts of the categories
+
+def _add_to_category_count(category_id, delta):
+    Category.objects.filter(pk=category_id).update(
+        active_listing_count=F("active_listing_count") + delta if delta > 0
+        else _less("active_listing_count", -delta))
+    transaction.on_commit(caching.invalidate_categories)
+
+
+@receiver(pre_save, sender=Listing)
+def remember_listing_category(sender, instance, raw=False, **kwargs):
+    # Edits (e.g. from the admin) may move or close a listing; closing
+    # through ListingQuerySet.close() skips this and sends listings_closed
+    instance._counted_as = None
+    if not raw and instance.pk is not None:
+        instance._counted_as = Listing.objects.filter(
+            pk=instance.pk, active=True).values_list(
+            "category_id", flat=True).first()
+
+
+@receiver(pre_save, sender=Listing)
+def stamp_closed_at(sender, instance, raw=False, **kwargs):
+    # Closing or reopening by an edit; ListingQuerySet.close() stamps its own
+    if raw:
+        return
+    if instance.active:
+        instance.closed_at = None
+    elif instance.closed_at is None:
+        instance.closed_at = timezone.now()
+
+
+@receiver(post_save, sender=Listing)
+def count_saved_listing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    counted_as = getattr(instance, "_counted_as", None)
+    now_counted_as = instance.category_id if instance.active else None
+    if counted_as == now_counted_as:
+        return
+    if counted_as is not None:
+        _add_to_category_count(counted_as, -1)
+    if now_counted_as is not None:
+        _add_to_category_count(now_counted_as, 1)
+
+
+@receiver(post_delete, sender=Listing)
+def uncount_deleted_listing(sender, instance, **kwargs):
+    if instance.active:
+        _add_to_category_count(instance.category_id, -1)
+
+
+@receiver(listings_closed)
+def uncount_closed_listings(sender, category_counts, **kwargs):
+    # One UPDATE for every category of the batch
+    Category.objects.filter(pk__in=category_counts).update(
+        active_listing_count=_less("active_listing_count", Case(
+            *[When(pk=category_id, then=Value(closed))
+              for category_id, closed in category_counts.items()],
+            output_field=IntegerField())))
+    transaction.on_commit(caching.invalidate_categories)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_cache(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(caching.invalidate_categories)
+
+
+# "My listings" summaries, set right by rebuild_user_summaries when they
+# drift
+
+def _summarize(user_id, **deltas):
+    UserSummary.objects.filter(user=user_id).update(**{
+        field: F(field) + delta if delta > 0 else _less(field, -delta)
+        for field, delta in deltas.items() if delta
+    })
+
+
+@receiver(post_save, sender=User)
+def create_user_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserSummary.objects.bulk_create([UserSummary(user=instance)],
+                                        ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Bid)
+def summarize_bid(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    # The seller's own initial bid is not a bid received
+    UserSummary.objects.filter(user=Subquery(
+        Listing.objects.filter(pk=instance.listing_id).values("author")[:1])
+    ).exclude(user=instance.user_id).update(
+        bids_received=F("bids_received") + 1)
+
+
+@receiver(post_save, sender=Listing)
+def summarize_saved_listing(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Set by remember_listing_category to the category the listing was
+    # counted in while active
+    was_active = getattr(instance, "_counted_as", None) is not None
+    if created:
+        _summarize(instance.author_id, **{
+            "active_listings" if instance.active else "closed_listings": 1})
+    elif was_active and not instance.active:
+        _summarize(instance.author_id, active_listings=-1, closed_listings=1,
+                   gross_sales=(instance.current_bid_amount
+                                if instance.winner_id else 0))
+        if instance.winner_id:
+            _summarize(instance.winner_id, auctions_won=1)
+    elif not was_active and instance.active:
+        _summarize(instance.author_id, active_listings=1, closed_listings=-1)
+
+
+@receiver(post_delete, sender=Listing)
+def unsummarize_deleted_listing(sender, instance, **kwargs):
+    if instance.active:
+        _summarize(instance.author_id, active_listings=-1)
+        return
+    sold = instance.winner_id is not None
+    _summarize(instance.author_id, closed_listings=-1,
+               gross_sales=-instance.current_bid_amount if sold else 0)
+    if sold:
+        _summarize(instance.winner_id, auctions_won=-1)
+
+
+@receiver(listings_closed)
+def summarize_closed_listings(sender, listing_ids, **kwargs):
+    """Fold a batch of closed listings into the summaries of their sellers
+    and winners, in one UPDATE each however many there are."""
+    closed = Listing.objects.filter(pk__in=listing_ids).order_by()
+    by_author = closed.filter(author=OuterRef("user")).values("author")
+    count = Subquery(by_author.annotate(total=Count("id")).values("total"),
+                     output_field=IntegerField())
+    sales = Subquery(by_author.filter(winner__isnull=False).annotate(
+        total=Sum("current_bid_amount")).values("total"),
+        output_field=DecimalField(max_digits=14, decimal_places=2))
+    UserSummary.objects.filter(user__in=closed.values("author")).update(
+        active_listings=_less("active_listings", count),
+        closed_listings=F("closed_listings") + count,
+        gross_sales=F("gross_sales") + Coalesce(sales, Value(Decimal(0))))
+    wins = closed.filter(winner=OuterRef("user")).values("winner").annotate(
+        total=Count("id")).values("total")
+    UserSummary.objects.filter(user__in=closed.values("winner")).update(
+        auctions_won=F("auctions_won") + Subquery(
+            wins, output_field=IntegerField()))
+
+
+# Cache invalidation. Counters are bumped once the transaction commits,
+# so a concurrent request can't cache the old state under the new version.
+
+@receiver(post_save, sender=Bid)
+@receiver(post_save, sender=Comment)
+def invalidate_listing_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: caching.invalidate_listings([listing_id]))
+
+
+@receiver(post_save, sender=Listing)
+def invalidate_saved_listing_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    listing_id = instance.pk
+    transaction.on_commit(
+        lambda: caching.invalidate_listings([listing_id], feed=True))
+
+
+@receiver(listings_closed)
+def invalidate_closed_listings_cache(sender, listing_ids, **kwargs):
+    transaction.on_commit(
+        lambda: caching.invalidate_listings(listing_ids, feed=True))
+
+
+# Full-text index
+
+@receiver(post_save, sender=Listing)
+def index_saved_listing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_listing(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_deleted_listing(sender, instance, **kwargs):
+    search.remove_listing(instance.pk)
+
+
+# Live events for the /listing/<pk>/events streams
+
+@receiver(post_save, sender=Bid)
+def publish_bid(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    transaction.on_commit(lambda: events.publish_listing_event(
+        instance.listing_id, "bid",
+        amount=str(instance.ammount),
+        bidder=instance.user.username,
+        created_at=instance.created_at.isoformat()))
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    transaction.on_commit(lambda: events.publish_listing_event(
+        instance.listing_id, "comment",
+        id=instance.pk,
+        author=instance.author.username,
+        body=instance.body,
+        created_at=instance.created_at.isoformat()))
+
+
+@receiver(listings_closed)
+def publish_closed(sender, listing_ids, **kwargs):
+    def publish():
+        for listing_id in listing_ids:
+            events.publish_listing_event(listing_id, "closed")
+    transaction.on_commit(publish)
+
+
+# Query timing for auctions.middleware.PerformanceMiddleware, on every
+# connection so it also sees the queries async views run in threads
+
+@receiver(connection_created)
+def install_sql_timer(sender, connection, **kwargs):
+    if not any(isinstance(wrapper, metrics.SQLTimer)
+               for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(metrics.SQLTimer())
+
+
+# SQLite tuning
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the AUCTIONS_SQLITE_PRAGMAS on each new SQLite connection."""
+    pragmas = settings.AUCTIONS_SQLITE_PRAGMAS
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (Count, DecimalField, IntegerField, OuterRef,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+
+from .models import Bid, Category, Listing, User, UserSummary
+
+
+def rebuild_bid_stats(listings=None, batch_size=1000):
+    """Recompute the denormalized bid columns of `listings` from the Bid table.
+
+    Works through the listings in primary-key batches, each one a single
+    UPDATE with correlated subqueries, so it never holds a long write lock
+    on big tables. Returns the number of listings updated.
+    """
+    if listings is None:
+        listings = Listing.objects.all()
+    top_bids = Bid.objects.filter(
+        listing=OuterRef("pk")).order_by("-ammount", "created_at", "id")
+    bid_counts = Bid.objects.filter(listing=OuterRef("pk")).order_by().values(
+        "listing").annotate(total=Count("id")).values("total")
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(listings.filter(pk__gt=last_pk).order_by(
+            "pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return updated
+        with transaction.atomic():
+            updated += Listing.objects.filter(pk__in=pks).update(
+                current_bid_amount=Coalesce(
+                    Subquery(top_bids.values("ammount")[:1]), Value(Decimal(0))),
+                current_bidder=Subquery(top_bids.values("user")[:1]),
+                bid_count=Coalesce(
+                    Subquery(bid_counts, output_field=IntegerField()), Value(0)),
+            )
+        last_pk = pks[-1]
+
+
+def rebuild_category_counts():
+    """Recompute the active listing count of every category.
+
+    Returns the number of categories updated.
+    """
+    active = Listing.objects.filter(
+        category=OuterRef("pk"), active=True).order_by().values(
+        "category").annotate(total=Count("id")).values("total")
+    return Category.objects.update(active_listing_count=Coalesce(
+        Subquery(active, output_field=IntegerField()), Value(0)))
+
+
+def _total(queryset, aggregate, output_field, zero):
+    return Coalesce(Subquery(queryset.annotate(total=aggregate).values("total"),
+                             output_field=output_field), Value(zero))
+
+
+def rebuild_user_summaries(users=None, batch_size=1000):
+    """Recompute the UserSummary of `users` from the listings and bids,
+    creating the missing ones.
+
+    Works through the users in primary-key batches like
+    `rebuild_bid_stats`. Returns the number of summaries updated.
+    """
+    if users is None:
+        users = User.objects.all()
+    authored = Listing.objects.filter(author=OuterRef("user")).order_by(
+        ).values("author")
+    received = Bid.objects.filter(listing__author=OuterRef("user")).exclude(
+        user=OuterRef("user")).order_by().values("listing__author")
+    won = Listing.objects.filter(winner=OuterRef("user"), active=False
+                                 ).order_by().values("winner")
+    count = Count("id")
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(users.filter(pk__gt=last_pk).order_by(
+            "pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return updated
+        with transaction.atomic():
+            UserSummary.objects.bulk_create(
+                [UserSummary(user_id=pk) for pk in pks], ignore_conflicts=True)
+            updated += UserSummary.objects.filter(user__in=pks).update(
+                active_listings=_total(authored.filter(active=True), count,
+                                       IntegerField(), 0),
+                closed_listings=_total(authored.filter(active=False), count,
+                                       IntegerField(), 0),
+                bids_received=_total(received, count, IntegerField(), 0),
+                gross_sales=_total(
+                    authored.filter(active=False, winner__isnull=False),
+                    Sum("current_bid_amount"),
+                    DecimalField(max_digits=14, decimal_places=2),
+                    Decimal(0)),
+                auctions_won=_total(won, count, IntegerField(), 0),
+            )
+        last_pk = pks[-1]
+
+
+def user_summary(user):
+    """Return the UserSummary of `user`, rebuilding it if it is missing."""
+    summary = UserSummary.objects.filter(user=user).first()
+    if summary is None:
+        rebuild_user_summaries(User.objects.filter(pk=user.pk))
+        summary = UserSummary.objects.get(user=user)
+    return summary
@@ -0,0 +1,13 @@
+from django import template
+from django.urls import reverse
+
+from auctions.thumbnails import url_hash
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(listing, size):
+    """URL of a listing's image resized to one of auctions.thumbnails.SIZES."""
+    return reverse("listing-thumbnail",
+                   args=(listing.id, size, url_hash(listing.img_url)))
@@ -1,3 +1,1919 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import (SyncToAsync, ThreadSensitiveContext, async_to_sync,
+                          sync_to_async)
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (api, caching, categories, digests, events, metrics, middleware,
+               models, pagination, ratelimit, routing, scheduler, search,
+               signals, thumbnails)
+from .models import User, Listing, Bid, Category, Comment, UserSummary
+from .bidding import BidStatus, place_bid
+from .middleware import ReplicaRoutingMiddleware
+
+
+def create_listing(author, category, price=10.0, **kwargs):
+    """Create a listing together with its initial bid, like `create_listing` does."""
+    now = timezone.now()
+    listing = Listing.objects.create(author=author,
+                                     category=category,
+                                     created_at=kwargs.pop("created_at", now),
+                                     title=kwargs.pop("title", "Item"),
+                                     description="Description",
+                                     img_url=kwargs.pop(
+                                         "img_url", "https://example.com/item.jpg"),
+                                     **kwargs)
+    Bid.objects.create(user=author, listing=listing,
+                       ammount=price, created_at=now)
+    listing.refresh_from_db()
+    return listing
+
+
+class ViewTestCase(TestCase):
+    """Start every test with an empty page cache and full rate limits."""
+
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        caching.reset_cache_stats()
+        ratelimit.get_backend().clear()
+
+
+class ListingBidStatsTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category, price=10.0)
+
+    def test_initial_bid_sets_stats(self):
+        self.assertEqual(self.listing.current_bid_amount, 10.0)
+        self.assertEqual(self.listing.current_bidder, self.seller)
+        self.assertEqual(self.listing.bid_count, 1)
+
+    def test_higher_bid_takes_over(self):
+        Bid.objects.create(user=self.buyer, listing=self.listing,
+                           ammount=15.0, created_at=timezone.now())
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, 15.0)
+        self.assertEqual(self.listing.current_bidder, self.buyer)
+        self.assertEqual(self.listing.bid_count, 2)
+
+    def test_lower_bid_only_counts(self):
+        Bid.objects.create(user=self.buyer, listing=self.listing,
+                           ammount=5.0, created_at=timezone.now())
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, 10.0)
+        self.assertEqual(self.listing.current_bidder, self.seller)
+        self.assertEqual(self.listing.bid_count, 2)
+
+    def test_rebuild_command(self):
+        Bid.objects.bulk_create([
+            Bid(user=self.buyer, listing=self.listing,
+                ammount=20.0, created_at=timezone.now()),
+        ])
+        Listing.objects.update(current_bid_amount=0,
+                               current_bidder=None, bid_count=0)
+        call_command("rebuild_listing_stats", stdout=io.StringIO())
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, 20.0)
+        self.assertEqual(self.listing.current_bidder, self.buyer)
+        self.assertEqual(self.listing.bid_count, 2)
+
+
+class PlaceBidTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category, price=10.0)
+
+    def test_accepted(self):
+        result = place_bid(self.listing.id, self.buyer, 12)
+        self.assertTrue(result.accepted)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, 12.0)
+        self.assertEqual(self.listing.current_bidder, self.buyer)
+        self.assertEqual(self.listing.bid_count, 2)
+
+    def test_outbid(self):
+        result = place_bid(self.listing.id, self.buyer, 10)
+        self.assertEqual(result.status, BidStatus.OUTBID)
+        self.assertEqual(result.current_amount, 10.0)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_closed(self):
+        Listing.objects.filter(pk=self.listing.id).update(active=False)
+        result = place_bid(self.listing.id, self.buyer, 50)
+        self.assertEqual(result.status, BidStatus.CLOSED)
+
+    def test_self_bid(self):
+        result = place_bid(self.listing.id, self.seller, 50)
+        self.assertEqual(result.status, BidStatus.SELF_BID)
+
+    def test_not_found(self):
+        result = place_bid(self.listing.id + 1, self.buyer, 50)
+        self.assertEqual(result.status, BidStatus.NOT_FOUND)
+
+
+class PlaceBidConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_bids_keep_price_strictly_increasing(self):
+        seller = User.objects.create_user("seller")
+        category = Category.objects.create(title="Toys")
+        listing = create_listing(seller, category, price=1.0)
+        bidders = [User.objects.create_user(f"bidder{i}")
+                   for i in range(8)]
+        accepted = []
+
+        def bid_loop(user, seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(25):
+                    amount = rng.randint(2, 400)
+                    if place_bid(listing.id, user, amount, max_retries=50).accepted:
+                        accepted.append(amount)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bid_loop, args=(user, i))
+                   for i, user in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        amounts = list(Bid.objects.filter(listing=listing).order_by(
+            "id").values_list("ammount", flat=True))
+        self.assertEqual(len(amounts), len(accepted) + 1)
+        self.assertTrue(all(a < b for a, b in zip(amounts, amounts[1:])))
+        listing.refresh_from_db()
+        self.assertEqual(listing.current_bid_amount, amounts[-1])
+        self.assertEqual(listing.bid_count, len(amounts))
+
+
+class CloseListingTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category, price=10.0)
+
+    def test_close_records_winner(self):
+        place_bid(self.listing.id, self.buyer, 12)
+        self.client.force_login(self.seller)
+        self.client.post(reverse("close", args=(self.listing.id,)))
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.active)
+        self.assertEqual(self.listing.winner, self.buyer)
+        self.assertEqual(list(self.buyer.won_listings.all()), [self.listing])
+
+    def test_close_without_bids_has_no_winner(self):
+        Listing.objects.filter(pk=self.listing.id).close()
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.active)
+        self.assertIsNone(self.listing.winner)
+
+    def test_only_author_can_close(self):
+        self.client.force_login(self.buyer)
+        self.client.post(reverse("close", args=(self.listing.id,)))
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.active)
+
+
+@override_settings(AUCTIONS_PAGE_SIZE=3)
+class IndexFeedTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.toys = Category.objects.create(title="Toys")
+        self.books = Category.objects.create(title="Books")
+        start = timezone.now()
+        # Listings 0..6 created in order, two of them sharing a timestamp
+        self.listings = [
+            create_listing(self.seller,
+                           self.toys if i % 2 else self.books,
+                           title=f"Item {i}",
+                           created_at=start + timedelta(minutes=min(i, 5)))
+            for i in range(7)
+        ]
+        self.closed = create_listing(self.seller, self.toys, title="Closed",
+                                     active=False)
+
+    def walk(self, params=None):
+        titles, cursor = [], None
+        while True:
+            query = dict(params or {})
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get(reverse("index"), query)
+            titles += re.findall(r'class="card-title"><a [^>]*>([^<]*)</a>',
+                                 "".join(response.context["cards"]))
+            cursor = response.context["next_cursor"]
+            if cursor is None:
+                return titles
+
+    def test_walks_active_listings_newest_first(self):
+        self.assertEqual(self.walk(),
+                         [f"Item {i}" for i in (6, 5, 4, 3, 2, 1, 0)])
+
+    def test_category_filter(self):
+        self.assertEqual(self.walk({"cat": self.toys.id}),
+                         ["Item 5", "Item 3", "Item 1"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("index"), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTests(ViewTestCase):
+    """Every page costs a fixed number of queries however much it renders."""
+    rows = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller")
+        cls.buyer = User.objects.create_user("buyer")
+        category = Category.objects.create(title="Toys")
+        now = timezone.now()
+
+        def listings(active):
+            return Listing.objects.bulk_create([
+                Listing(author=cls.seller, category=category, created_at=now,
+                        title=f"Item {i}", description="Description",
+                        img_url="https://example.com/item.jpg", active=active,
+                        current_bid_amount=2.0, current_bidder=cls.buyer,
+                        bid_count=2, winner=None if active else cls.buyer)
+                for i in range(cls.rows)
+            ])
+
+        active, closed = listings(True), listings(False)
+        cls.listing = active[0]
+        Bid.objects.bulk_create([
+            Bid(user=user, listing=listing, ammount=amount, created_at=now)
+            for listing in active + closed
+            for user, amount in ((cls.seller, 1.0), (cls.buyer, 2.0))
+        ])
+        Comment.objects.bulk_create([
+            Comment(author=cls.buyer if i % 2 else cls.seller,
+                    listing=cls.listing, body="Comment", created_at=now)
+            for i in range(cls.rows)
+        ])
+        cls.buyer.watchlist.add(*active)
+
+    def assertQueryBudget(self, user, url, budget):
+        if user is not None:
+            self.client.force_login(user)
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_index(self):
+        # Category catalogue, then the feed page
+        self.assertQueryBudget(None, reverse("index"), 2)
+
+    def test_categories(self):
+        self.assertQueryBudget(None, reverse("categories"), 1)
+
+    def test_listing_anonymous(self):
+        self.assertQueryBudget(
+            None, reverse("listing", args=(self.listing.id,)), 2)
+
+    def test_listing(self):
+        # Session and user lookups, then listing, watch state and comments
+        self.assertQueryBudget(
+            self.buyer, reverse("listing", args=(self.listing.id,)), 5)
+
+    def test_watchlist(self):
+        self.assertQueryBudget(self.buyer, reverse("watchlist"), 3)
+
+    def test_my_listings_seller(self):
+        self.assertQueryBudget(self.seller, reverse("my-listings"), 4)
+
+    def test_my_listings_buyer(self):
+        self.assertQueryBudget(self.buyer, reverse("my-listings"), 4)
+
+    def test_close(self):
+        self.assertQueryBudget(
+            self.seller, reverse("close", args=(self.listing.id,)), 3)
+
+    def test_create_form(self):
+        self.assertQueryBudget(self.seller, reverse("create-listing"), 3)
+
+
+class LargeQueryBudgetTests(QueryBudgetTests):
+    rows = 1000
+
+
+class PageCacheTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category, price=10.0)
+        self.url = reverse("listing", args=(self.listing.id,))
+
+    def test_listing_page_hit_skips_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'id="current-price">10.00')
+        self.assertEqual(caching.cache_stats()["listing_hits"], 1)
+        self.assertEqual(caching.cache_stats()["listing_misses"], 1)
+
+    def test_index_hit_skips_queries(self):
+        self.client.get(reverse("index"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "Price: </strong>$ 10.00")
+        self.assertEqual(caching.cache_stats()["card_hits"], 1)
+
+    @override_settings(AUCTIONS_CACHE_VERSION_TIMEOUT=600)
+    def test_version_counters_expire(self):
+        # Even those of listings that don't exist
+        names = [f"listing:{self.listing.id + 1}",
+                 f"listing:{self.listing.id + 2}"]
+        caching.version_token([self.listing.id + 1])
+        async_to_sync(caching.aversion_token)([self.listing.id + 2])
+        cache = caching.get_cache()
+        keys = [caching._version_key(name) for name in names]
+        self.assertEqual(len(cache.get_many(keys)), 2)
+        later = time.time() + 601
+        with mock.patch("time.time", return_value=later):
+            self.assertEqual(cache.get_many(keys), {})
+
+    def test_bid_invalidates_listing_and_card(self):
+        self.client.get(self.url)
+        self.client.get(reverse("index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.buyer, 25)
+        self.assertContains(self.client.get(self.url), 'id="current-price">25.00')
+        self.assertContains(self.client.get(reverse("index")),
+                            "Price: </strong>$ 25.00")
+
+    def test_comment_invalidates_listing(self):
+        self.client.get(self.url)
+        self.client.force_login(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {"send_comment": "Send",
+                                        "comment_body": "Still available?"})
+        self.assertContains(self.client.get(self.url), "Still available?")
+
+    def test_close_invalidates_feed(self):
+        self.client.get(reverse("index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(pk=self.listing.id).close()
+        self.assertContains(self.client.get(reverse("index")),
+                            "There are no listings to show.")
+
+    def test_per_user_parts_are_not_cached(self):
+        self.buyer.watchlist.add(self.listing)
+        self.client.force_login(self.buyer)
+        self.assertContains(self.client.get(self.url), "Remove from Watchlist")
+        self.client.force_login(User.objects.create_user("other"))
+        self.assertContains(self.client.get(self.url), "Add to watchlist")
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            with self.settings(CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": location,
+            }}):
+                self.client.get(self.url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(self.url)
+                self.assertContains(response, "There are no comments yet.")
+
+
+class SearchTests(ViewTestCase):
+    backend = "fts5"
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.toys = Category.objects.create(title="Toys")
+        self.books = Category.objects.create(title="Books")
+        override = self.settings(AUCTIONS_SEARCH_BACKEND=self.backend)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.in_title = create_listing(self.seller, self.toys,
+                                       title="Red bicycle")
+        self.in_description = create_listing(self.seller, self.toys,
+                                             title="Helmet")
+        self.in_description.description = "Fits any red bicycle rider"
+        self.in_description.save()
+        self.other_category = create_listing(self.seller, self.books,
+                                             title="Bicycle repair manual")
+        self.closed = create_listing(self.seller, self.toys,
+                                     title="Old red bicycle", active=False)
+
+    def search(self, **params):
+        response = self.client.get(reverse("search"), params)
+        return [listing.title for listing in response.context["results"]]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.search(q="red bicycle"),
+                         ["Red bicycle", "Helmet"])
+
+    def test_category_filter(self):
+        self.assertEqual(self.search(q="bicycle", cat=self.books.id),
+                         ["Bicycle repair manual"])
+
+    def test_include_closed(self):
+        self.assertIn("Old red bicycle",
+                      self.search(q="red bicycle", include_closed=1))
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.search(q="red manual"), [])
+        self.assertEqual(self.search(q="!!!"), [])
+
+    @override_settings(AUCTIONS_SEARCH_RANKED_MATCHES=1)
+    def test_broad_query_lists_title_matches_newest_first(self):
+        if self.backend != "fts5":
+            self.skipTest("Only FTS5 falls back for broad queries")
+        self.assertEqual(self.search(q="bicycle"), [
+            "Bicycle repair manual", "Red bicycle", "Helmet"])
+        self.assertEqual(self.search(q="bicycle", cat=self.toys.id),
+                         ["Red bicycle", "Helmet"])
+
+    def test_created_listing_is_indexed(self):
+        self.client.force_login(self.seller)
+        self.client.post(reverse("create-listing"), {
+            "title": "Tandem bicycle", "description": "For two",
+            "base_bid": 50, "category": self.toys.id, "duration": 7,
+        })
+        self.assertEqual(self.search(q="tandem"), ["Tandem bicycle"])
+
+    def test_rebuild_command(self):
+        search.get_backend().clear()
+        self.assertEqual(self.search(q="helmet"), [])
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.search(q="helmet"), ["Helmet"])
+
+
+class InvertedIndexSearchTests(SearchTests):
+    backend = "inverted"
+
+
+class SeedAuctionsTests(TestCase):
+
+    def seed(self):
+        call_command("seed_auctions", seed=7, users=5, listings=30,
+                     max_bids=6, max_comments=2, watches=3, batch_size=8,
+                     overdue_ratio=0.3, stdout=io.StringIO())
+        return list(Bid.objects.order_by("listing__title", "listing__created_at",
+                                         "ammount").values_list(
+            "listing__title", "user__username", "ammount"))
+
+    def test_seeded_data_is_consistent(self):
+        self.seed()
+        self.assertEqual(Listing.objects.count(), 30)
+        stats = list(Listing.objects.order_by("pk").values_list(
+            "current_bid_amount", "current_bidder", "bid_count", "winner"))
+        counts = list(Category.objects.order_by("pk").values_list(
+            "active_listing_count", flat=True))
+        self.assertGreater(sum(counts), 0)
+        call_command("rebuild_listing_stats", stdout=io.StringIO())
+        self.assertEqual(stats, list(Listing.objects.order_by("pk").values_list(
+            "current_bid_amount", "current_bidder", "bid_count", "winner")))
+        self.assertEqual(counts, list(Category.objects.order_by(
+            "pk").values_list("active_listing_count", flat=True)))
+        for listing in Listing.objects.all():
+            amounts = list(listing.bids.order_by("created_at", "id").values_list(
+                "ammount", flat=True))
+            self.assertEqual(amounts, sorted(set(amounts)))
+
+    def test_seeding_again_reuses_the_users(self):
+        self.seed()
+        self.seed()
+        self.assertEqual(User.objects.filter(
+            username__startswith="seed7-user").count(), 5)
+        self.assertEqual(Listing.objects.count(), 60)
+
+    def test_seeded_end_times(self):
+        self.seed()
+        now = timezone.now()
+        closed = Listing.objects.filter(active=False)
+        self.assertTrue(closed.exists())
+        for listing in closed:
+            self.assertEqual(listing.closed_at, listing.ends_at)
+            self.assertLess(listing.ends_at, now)
+            self.assertFalse(listing.bids.filter(
+                created_at__gt=listing.ends_at).exists())
+        running = Listing.objects.filter(active=True)
+        self.assertFalse(running.filter(ends_at=None).exists())
+        self.assertTrue(running.filter(ends_at__gt=now).exists())
+        # The overdue ones are left to the scheduler
+        overdue = running.expired(now).count()
+        self.assertGreater(overdue, 0)
+        self.assertEqual(scheduler.close_expired_listings(), overdue)
+
+    def test_same_seed_same_data(self):
+        first = self.seed()
+        Listing.objects.all().delete()
+        User.objects.all().delete()
+        self.assertEqual(self.seed(), first)
+
+
+class PerformanceMiddlewareTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.seller = User.objects.create_user("seller")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+
+    def test_records_request_metrics(self):
+        with self.assertLogs("auctions.metrics", "INFO") as logs:
+            response = self.client.get(reverse("listing",
+                                               args=(self.listing.id,)))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "listing")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["sql_count"], 2)
+        self.assertGreater(record["template_ms"], 0)
+        self.assertEqual(record["response_bytes"], len(response.content))
+        self.assertEqual(metrics.snapshot()["listing"]["wall_ms"]["count"], 1)
+
+    @override_settings(AUCTIONS_METRICS_SAMPLE_RATE=0)
+    def test_sampling(self):
+        self.client.get(reverse("index"))
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_endpoint_is_staff_only(self):
+        self.client.get(reverse("index"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 302)
+        self.client.force_login(User.objects.create_user("staff",
+                                                         is_staff=True))
+        response = self.client.get(reverse("metrics"))
+        self.assertIn("index", response.json()["views"])
+
+
+class ListingEventsTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+        self.url = reverse("listing-events", args=(self.listing.id,))
+
+    def test_needs_asgi(self):
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+
+    async def test_streams_listing_events(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        # Subscribes when the stream starts
+        next_message = asyncio.ensure_future(anext(stream))
+        while not events.get_broker().subscriber_count(
+                events.listing_channel(self.listing.id)):
+            await asyncio.sleep(0.01)
+        events.publish_listing_event(self.listing.id, "bid", amount=12.0,
+                                     bidder="buyer")
+        message = (await next_message).decode()
+        self.assertTrue(message.startswith("event: bid\ndata: "))
+        self.assertEqual(json.loads(message.split("data: ")[1])["amount"], 12.0)
+        # A client disconnect cancels the pending read
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(events.get_broker().subscriber_count(), 0)
+
+    async def test_unknown_listing(self):
+        response = await self.async_client.get(
+            reverse("listing-events", args=(self.listing.id + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    @unittest.skipUnless(
+        hasattr(SyncToAsync, "context_to_thread_executor"),
+        "asgiref keeps its request threads elsewhere")
+    def test_streams_release_the_request_thread(self):
+        before = threading.active_count()
+
+        async def request():
+            # As the ASGI handler runs each request
+            async with ThreadSensitiveContext():
+                await sync_to_async(lambda: None)()
+                self.assertEqual(threading.active_count(), before + 1)
+                await events.release_request_thread()
+                for _ in range(100):
+                    if threading.active_count() == before:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(threading.active_count(), before)
+
+        asyncio.run(request())
+
+    def test_comments_can_be_inserted_live(self):
+        comment = Comment.objects.create(author=self.buyer,
+                                         listing=self.listing, body="Hi",
+                                         created_at=timezone.now())
+        response = self.client.get(reverse("listing", args=(self.listing.id,)))
+        self.assertContains(response, f'id="comment-{comment.id}"')
+        self.assertContains(response, 'const seller = "seller"')
+
+    def test_bid_comment_and_close_are_published(self):
+        published = []
+        broker = events.get_broker()
+        original = broker.publish
+        broker.publish = lambda channel, event: published.append(event)
+        self.addCleanup(setattr, broker, "publish", original)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.buyer, 20)
+            Comment.objects.create(author=self.buyer, listing=self.listing,
+                                   body="Hi", created_at=timezone.now())
+            Listing.objects.filter(pk=self.listing.id).close()
+        self.assertEqual([event["type"] for event in published],
+                         ["bid", "comment", "closed"])
+        self.assertEqual(published[0]["bidder"], "buyer")
+
+
+class InProcessBrokerTests(TestCase):
+
+    async def test_slow_subscriber_is_dropped(self):
+        broker = events.InProcessBroker(queue_size=2)
+        subscription = broker.subscribe("channel")
+        for i in range(3):
+            broker.publish("channel", {"i": i})
+        await asyncio.sleep(0)
+        self.assertIsNone(await subscription.get())
+        subscription.close()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class ListingExpiryTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.now = timezone.now()
+
+    def test_create_sets_end_time(self):
+        self.client.force_login(self.seller)
+        self.client.post(reverse("create-listing"), {
+            "title": "Lamp", "description": "Bright", "base_bid": 5,
+            "category": self.category.id, "duration": 3,
+        })
+        listing = Listing.objects.get(title="Lamp")
+        self.assertAlmostEqual(listing.ends_at - listing.created_at,
+                               timedelta(days=3),
+                               delta=timedelta(seconds=1))
+
+    def test_closes_expired_listings_in_batches(self):
+        expired = [create_listing(self.seller, self.category,
+                                  ends_at=self.now - timedelta(minutes=i))
+                   for i in range(1, 6)]
+        Listing.objects.filter(pk=expired[0].id).update(ends_at=None)
+        place_bid(expired[0].id, self.buyer, 50)
+        Listing.objects.filter(pk=expired[0].id).update(ends_at=self.now)
+        running = create_listing(self.seller, self.category,
+                                 ends_at=self.now + timedelta(days=1))
+        open_ended = create_listing(self.seller, self.category)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(scheduler.close_expired_listings(batch_size=2), 5)
+        # Listing cache, category cache and events, per batch
+        self.assertEqual(len(callbacks), 3 * 3)
+        self.assertEqual(set(Listing.objects.filter(active=True)),
+                         {running, open_ended})
+        expired[0].refresh_from_db()
+        self.assertEqual(expired[0].winner, self.buyer)
+        self.assertEqual(expired[0].current_bid_amount, 50)
+        self.assertEqual(scheduler.close_expired_listings(), 0)
+
+    def test_bids_rejected_after_end_time(self):
+        listing = create_listing(self.seller, self.category,
+                                 ends_at=self.now - timedelta(seconds=1))
+        result = place_bid(listing.id, self.buyer, 50)
+        self.assertEqual(result.status, BidStatus.CLOSED)
+
+    def test_expiry_query_uses_index(self):
+        sql, params = Listing.objects.expired(self.now).order_by(
+            "ends_at").values_list("pk").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("listing_open_ends_at_idx", plan)
+
+
+class WatchlistApiTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+        self.url = reverse("watchlist-api", args=(self.listing.id,))
+        self.client.force_login(self.buyer)
+
+    def post(self, body=None, url=None):
+        return self.client.post(url or self.url,
+                                json.dumps(body) if body is not None else "",
+                                content_type="application/json")
+
+    def test_set_is_idempotent(self):
+        for _ in range(2):
+            response = self.post({"watching": True})
+            self.assertEqual(response.json(), {"listing_id": self.listing.id,
+                                               "watching": True,
+                                               "watchers": 1})
+        for _ in range(2):
+            response = self.post({"watching": False})
+            self.assertEqual(response.json()["watching"], False)
+            self.assertEqual(response.json()["watchers"], 0)
+
+    def test_toggle_without_body(self):
+        self.assertTrue(self.post().json()["watching"])
+        self.assertFalse(self.post().json()["watching"])
+
+    def test_query_count_independent_of_watchers(self):
+        for i in range(50):
+            User.objects.create_user(f"watcher{i}").watchlist.add(self.listing)
+        # Session, user, listing exists, membership, write, count
+        with self.assertNumQueries(6):
+            response = self.post()
+        self.assertEqual(response.json()["watchers"], 51)
+
+    def test_errors(self):
+        self.assertEqual(self.post({"watching": "yes"}).status_code, 400)
+        self.assertEqual(self.post(url=reverse(
+            "watchlist-api", args=(self.listing.id + 1,))).status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.post().status_code, 401)
+
+
+class DecimalBidTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"),
+                                      price=Decimal("0.30"))
+        self.url = reverse("listing", args=(self.listing.id,))
+
+    def test_no_float_rounding(self):
+        # 0.1 + 0.2 > 0.3 in floating point
+        result = place_bid(self.listing.id, self.buyer, 0.1 + 0.2)
+        self.assertEqual(result.status, BidStatus.OUTBID)
+        self.assertTrue(place_bid(self.listing.id, self.buyer, "0.31").accepted)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, Decimal("0.31"))
+
+    def test_view_rejects_invalid_amounts(self):
+        self.client.force_login(self.buyer)
+        for amount in ("abc", "1.001", "NaN", "1e12"):
+            response = self.client.post(self.url, {"add_bid": "Place bid",
+                                                   "bid_ammount": amount})
+            self.assertContains(response, "Please enter a valid bid.")
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_top_bid_uses_index(self):
+        sql, params = Bid.objects.filter(listing=self.listing).order_by(
+            "-ammount")[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("bid_listing_top_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class ListingHistoryTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"),
+                                      price=Decimal("1"))
+        start = datetime(2025, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        # Bids at 12:00:10, 12:00:40, 12:01:10, ... one minute per two bids
+        Bid.objects.filter(listing=self.listing).update(created_at=start)
+        Bid.objects.bulk_create([
+            Bid(user=self.buyer, listing=self.listing,
+                ammount=Decimal(amount),
+                created_at=start + timedelta(seconds=10 + 30 * i))
+            for i, amount in enumerate(["2", "5", "3", "4", "6", "7"])
+        ])
+        self.url = reverse("listing-history", args=(self.listing.id,))
+
+    def test_paginates_bids_in_time_order(self):
+        amounts, cursor = [], None
+        while True:
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get(self.url, params).json()
+            amounts += [bid["amount"] for bid in data["bids"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(amounts, ["1.00", "2.00", "5.00", "3.00", "4.00",
+                                   "6.00", "7.00"])
+
+    def test_ohlc_buckets(self):
+        # Listing lookup, grouped buckets, opening and closing prices
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {"interval": "minute",
+                                              "limit": 2}).json()
+        self.assertEqual(data["buckets"], [
+            {"start": "2025-01-01T12:00:00Z", "open": "1.00", "high": "5.00",
+             "low": "1.00", "close": "5.00", "bids": 3},
+            {"start": "2025-01-01T12:01:00Z", "open": "3.00", "high": "4.00",
+             "low": "3.00", "close": "4.00", "bids": 2},
+        ])
+        data = self.client.get(self.url, {"interval": "minute",
+                                          "cursor": data["next_cursor"]}).json()
+        self.assertEqual(data["buckets"], [
+            {"start": "2025-01-01T12:02:00Z", "open": "6.00", "high": "7.00",
+             "low": "6.00", "close": "7.00", "bids": 2},
+        ])
+        self.assertIsNone(data["next_cursor"])
+
+    def test_ohlc_cursor_needs_no_encoding(self):
+        cursor = self.client.get(self.url, {"interval": "minute",
+                                            "limit": 2}).json()["next_cursor"]
+        data = self.client.get(
+            f"{self.url}?interval=minute&cursor={cursor}").json()
+        self.assertEqual([bucket["start"] for bucket in data["buckets"]],
+                         ["2025-01-01T12:02:00Z"])
+
+    def test_ohlc_cursor_must_be_aware(self):
+        for moment in ("2025-01-01T12:02:00", "2025-01-01T12:02:00+00:00"):
+            with self.subTest(moment=moment):
+                self.assertEqual(self.client.get(self.url, {
+                    "interval": "minute", "cursor": moment}).status_code, 400)
+        naive = pagination.encode_time_cursor(datetime(2025, 1, 1, 12, 2))
+        self.assertEqual(self.client.get(self.url, {
+            "interval": "minute", "cursor": naive}).status_code, 400)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {"interval": "week"})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"cursor": "x"})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": "0"})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(reverse(
+            "listing-history", args=(self.listing.id + 1,))).status_code, 404)
+
+
+@override_settings(AUCTIONS_DB_REPLICAS=["replica"])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routing.ReplicaRouter()
+        self.reads = []
+        # Start clean of the writes of other tests in this thread
+        token = routing.use_primary.set(False)
+        self.addCleanup(routing.use_primary.reset, token)
+
+        def view(request):
+            if request.path == "/bid":
+                self.router.db_for_write(Bid)
+            self.reads.append(self.router.db_for_read(Listing))
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Listing), "replica")
+        self.assertEqual(self.router.db_for_write(Bid), "default")
+        self.assertEqual(self.router.db_for_read(Listing), "default")
+
+    @override_settings(AUCTIONS_DB_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.router.db_for_read(Listing), "default")
+        response = self.middleware(self.factory.post("/bid"))
+        self.assertNotIn("auctions_primary", response.cookies)
+
+    def test_reads_own_writes_after_posting(self):
+        cookie = ReplicaRoutingMiddleware.cookie_name
+        self.assertNotIn(cookie, self.middleware(
+            self.factory.get("/")).cookies)
+        response = self.middleware(self.factory.post("/bid"))
+        self.assertEqual(response.cookies[cookie]["max-age"], 5)
+
+        pinned = self.factory.get("/")
+        pinned.COOKIES[cookie] = "1"
+        # Reading while pinned does not extend the pin
+        self.assertNotIn(cookie, self.middleware(pinned).cookies)
+        self.assertEqual(self.reads, ["replica", "default", "default"])
+        # The pin does not leak past the request
+        self.assertEqual(self.router.db_for_read(Listing), "replica")
+
+    def test_async_view_writing_in_a_thread(self):
+        async def view(request):
+            await sync_to_async(self.router.db_for_write)(Bid)
+            self.reads.append(self.router.db_for_read(Listing))
+            return HttpResponse()
+
+        response = async_to_sync(ReplicaRoutingMiddleware(view))(
+            self.factory.get("/"))
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+        self.assertEqual(self.reads, ["default"])
+
+    def test_cache_misses_are_built_from_the_primary(self):
+        caching.get_cache().clear()
+        self.addCleanup(caching.get_cache().clear)
+
+        def build():
+            self.reads.append(self.router.db_for_read(Listing))
+            return "page"
+
+        async def abuild(*args):
+            await sync_to_async(build)()
+            return {pk: "card" for pk in args[0]} if args else "page"
+
+        caching.cached_comments_page(1, None, build)
+        async_to_sync(caching.acached_listing_page)(1, abuild)
+        async_to_sync(caching.acached_cards)([1], abuild)
+        self.assertEqual(self.reads, ["default"] * 3)
+        # Hits build nothing, and other reads still go to the replicas
+        caching.cached_comments_page(1, None, build)
+        self.assertEqual(len(self.reads), 3)
+        self.assertEqual(self.router.db_for_read(Listing), "replica")
+
+
+class SqlitePragmaTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @override_settings(AUCTIONS_SQLITE_PRAGMAS={"busy_timeout": 1234,
+                                                "cache_size": -2048})
+    def test_applied_on_connect(self):
+        signals.apply_sqlite_pragmas(sender=type(connection),
+                                     connection=connection)
+        self.assertEqual(self.pragma("busy_timeout"), 1234)
+        self.assertEqual(self.pragma("cache_size"), -2048)
+
+
+@contextmanager
+def race_close(listing):
+    """Have another process close `listing` right after the next close()
+    read the listings it is about to close."""
+    values_list = models.ListingQuerySet.values_list
+    raced = []
+
+    def read_then_race(queryset, *fields, **kwargs):
+        rows = list(values_list(queryset, *fields, **kwargs))
+        if not raced:
+            raced.append(listing)
+            Listing.objects.filter(pk=listing.pk).update(active=False)
+        return rows
+
+    with mock.patch.object(models.ListingQuerySet, "values_list",
+                           read_then_race):
+        yield
+    assert raced, "close() never read its listings"
+
+
+class CategoryCatalogueTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.toys = Category.objects.create(title="Toys")
+        self.books = Category.objects.create(title="Books")
+
+    def counts(self):
+        return {category["title"]: category["active_count"]
+                for category in categories.catalogue()}
+
+    def test_counts_follow_listings(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listings = [create_listing(self.seller, self.toys)
+                        for _ in range(3)]
+        self.assertEqual(self.counts(), {"Books": 0, "Toys": 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(pk__in=[listings[0].id, listings[1].id]).close()
+            listings[2].category = self.books
+            listings[2].save()
+        self.assertEqual(self.counts(), {"Books": 1, "Toys": 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listings[2].delete()
+        self.assertEqual(self.counts(), {"Books": 0, "Toys": 0})
+
+    def test_concurrent_close_counts_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = [create_listing(self.seller, self.toys)
+                             for _ in range(2)]
+        with race_close(first):
+            self.assertEqual(Listing.objects.filter(
+                pk__in=[first.id, second.id]).close(), 1)
+        # The other close would have counted `first` itself
+        self.assertEqual(Category.objects.get(pk=self.toys.id)
+                         .active_listing_count, 1)
+        self.assertFalse(Listing.objects.filter(active=True).exists())
+
+    def test_drifted_count_stops_at_zero(self):
+        listings = [create_listing(self.seller, self.toys) for _ in range(3)]
+        Category.objects.filter(pk=self.toys.id).update(
+            active_listing_count=0)
+        self.assertEqual(Listing.objects.filter(pk=listings[0].id).close(), 1)
+        listings[1].active = False
+        listings[1].save()
+        listings[2].delete()
+        self.assertEqual(Category.objects.get(pk=self.toys.id)
+                         .active_listing_count, 0)
+
+    def test_pages_read_the_cached_catalogue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_listing(self.seller, self.toys)
+        self.client.get(reverse("categories"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("categories"))
+        self.assertContains(response, "Toys</a> (1)")
+        self.assertContains(response, "Books (no active listings)")
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse("create-listing"))
+        self.assertContains(response, f'<option value="{self.books.id}">Books')
+        self.assertEqual(caching.cache_stats()["categories_misses"], 1)
+
+    def test_index_filter(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_listing(self.seller, self.toys, title="Robot")
+        response = self.client.get(reverse("index"), {"cat": self.toys.id})
+        self.assertContains(response, "Robot")
+        self.assertContains(response, 'Toys <span class="badge badge-light">1')
+        self.assertNotContains(response, "Books")
+        self.assertEqual(self.client.get(reverse("index"), {"cat": "99"})
+                         .status_code, 400)
+
+
+FETCHED = []
+
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+
+
+def fake_fetch(url):
+    """Thumbnail fetcher of the tests: a 2x1 GIF, an error for "broken" URLs
+    and a scripted SVG for "svg" ones, labelled as a PNG for "disguised" ones."""
+    FETCHED.append(url)
+    if "broken" in url:
+        raise thumbnails.FetchError("unreachable")
+    if "svg" in url:
+        return SVG, "image/png" if "disguised" in url else "image/svg+xml"
+    return (b"GIF89a\x02\x00\x01\x00\x80\x00\x00\xff\x00\x00\x00\x00\xff"
+            b"!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00\x00\x00\x02\x00\x01"
+            b"\x00\x00\x02\x02\x04\n\x00;", "image/gif")
+
+
+class ThumbnailTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings = override_settings(
+            AUCTIONS_THUMBNAIL_FETCHER="auctions.tests.fake_fetch",
+            AUCTIONS_THUMBNAIL_DIR=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        FETCHED.clear()
+        self.seller = User.objects.create_user("seller")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category,
+                                      img_url="https://example.com/a.gif")
+
+    def thumbnail_url(self, listing, size="card"):
+        return reverse("listing-thumbnail", args=(
+            listing.id, size, thumbnails.url_hash(listing.img_url)))
+
+    def test_fetches_once_and_serves_from_disk(self):
+        url = self.thumbnail_url(self.listing)
+        self.assertContains(self.client.get(reverse("index")), url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"],
+                         "public, max-age=31536000, immutable")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+        self.assertEqual(response["Content-Security-Policy"],
+                         "default-src 'none'")
+        body = b"".join(response.streaming_content)
+        self.assertEqual(thumbnails.Image.open(io.BytesIO(body)).format,
+                         "JPEG")
+
+        # Another listing with the same image shares its thumbnail
+        other = create_listing(self.seller, self.category,
+                               img_url=self.listing.img_url)
+        with self.assertNumQueries(0):
+            again = self.client.get(self.thumbnail_url(other))
+        self.assertEqual(b"".join(again.streaming_content), body)
+        self.assertEqual(again["ETag"], response["ETag"])
+        self.assertEqual(FETCHED, [self.listing.img_url])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(
+            self.thumbnail_url(self.listing, "huge")).status_code, 404)
+        # The hash of another URL, e.g. after the image was changed
+        self.assertEqual(self.client.get(reverse("listing-thumbnail", args=(
+            self.listing.id, "card", thumbnails.url_hash("https://x")))
+        ).status_code, 404)
+        broken = create_listing(self.seller, self.category,
+                                img_url="https://example.com/broken.gif")
+        self.assertEqual(self.client.get(
+            self.thumbnail_url(broken)).status_code, 502)
+
+    def test_failures_are_not_refetched_until_they_expire(self):
+        broken = create_listing(self.seller, self.category,
+                                img_url="https://example.com/broken.gif")
+        url = self.thumbnail_url(broken)
+        self.assertEqual(self.client.get(url).status_code, 502)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response["Cache-Control"], "max-age=300")
+        self.assertEqual(FETCHED, [broken.img_url])
+        with override_settings(AUCTIONS_THUMBNAIL_FAILURE_TTL=0):
+            self.assertEqual(self.client.get(url).status_code, 502)
+        self.assertEqual(FETCHED, [broken.img_url] * 2)
+
+    def test_walks_the_blobs_only_when_over_the_limit(self):
+        cache = thumbnails.ThumbnailCache(self.root, max_bytes=25)
+        with mock.patch.object(thumbnails.os, "walk",
+                               wraps=thumbnails.os.walk) as walk:
+            for i, name in enumerate(["a", "b"]):
+                path, _, _ = cache.put(name, "card", name.encode() * 10,
+                                       "image/gif")
+                os.utime(path, (i, i))
+            # Only the first write of the process counts what is there
+            self.assertEqual(walk.call_count, 1)
+            cache.put("c", "card", b"c" * 10, "image/gif")
+            self.assertEqual(walk.call_count, 2)
+        self.assertIsNone(cache.get("a", "card"))
+        self.assertIsNotNone(cache.get("c", "card"))
+
+    def test_only_raster_images(self):
+        for name in ("a.svg", "disguised-svg.png"):
+            with self.subTest(name=name):
+                listing = create_listing(
+                    self.seller, self.category,
+                    img_url=f"https://example.com/{name}")
+                response = self.client.get(self.thumbnail_url(listing))
+                self.assertEqual(response.status_code, 502)
+                self.assertNotIn(b"<script>", response.content)
+        with self.assertRaises(thumbnails.FetchError):
+            thumbnails.resize(SVG, "image/svg+xml", "card")
+
+    def test_fetch_only_public_addresses(self):
+        for url in ("http://127.0.0.1/a.png", "http://localhost:8000/a.png",
+                    "http://10.0.0.1/a.png", "http://192.168.1.1/a.png",
+                    "http://169.254.169.254/latest/meta-data/",
+                    "http://[::1]/a.png", "http://[::ffff:127.0.0.1]/a.png",
+                    "http://0.0.0.0/a.png", "file:///etc/passwd",
+                    "ftp://example.com/a.png"):
+            with self.subTest(url=url), self.assertRaises(
+                    thumbnails.FetchError):
+                thumbnails.fetch_url(url)
+        thumbnails.check_address("93.184.216.34")
+
+        # Redirects are held to the same rule
+        request = urllib.request.Request("https://example.com/a.png")
+        with self.assertRaises(thumbnails.FetchError):
+            thumbnails._PublicRedirectHandler().redirect_request(
+                request, None, 302, "Found", {}, "http://127.0.0.1/admin")
+
+    def test_evicts_least_recently_used(self):
+        cache = thumbnails.ThumbnailCache(self.root, max_bytes=25)
+        for i, name in enumerate(["a", "b"]):
+            path, _, _ = cache.put(name, "card", name.encode() * 10, "image/gif")
+            os.utime(path, (i, i))
+        # Serving "a" makes "b" the least recently used
+        cache.get("a", "card")
+        cache.put("c", "card", b"c" * 10, "image/gif")
+        self.assertIsNotNone(cache.get("a", "card"))
+        self.assertIsNone(cache.get("b", "card"))
+        self.assertIsNotNone(cache.get("c", "card"))
+
+    def test_resizes_to_fit(self):
+        source = io.BytesIO()
+        thumbnails.Image.new("RGB", (1000, 500)).save(source, "PNG")
+        data, content_type = thumbnails.resize(source.getvalue(), "image/png",
+                                               "card")
+        self.assertEqual(content_type, "image/jpeg")
+        self.assertEqual(thumbnails.Image.open(io.BytesIO(data)).size,
+                         (300, 150))
+
+
+class ConditionalResponseTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+        self.url = reverse("listing", args=(self.listing.id,))
+
+    def assertNotModified(self, url, etag, queries=0):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertIn("Cookie", response["Vary"])
+
+    def test_listing(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotModified(self.url, etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.buyer, 25)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_listing_per_user(self):
+        anonymous = self.client.get(self.url)["ETag"]
+        self.client.force_login(self.buyer)
+        etag = self.client.get(self.url)["ETag"]
+        self.assertNotEqual(etag, anonymous)
+        # Session, user and watch state lookups only
+        self.assertNotModified(self.url, etag, queries=3)
+
+        self.client.get(reverse("set-watchlist", args=(self.listing.id,)))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_after_logging_in_again(self):
+        self.buyer.set_password("secret")
+        self.buyer.save()
+        credentials = {"username": "buyer", "password": "secret"}
+        self.client.post(reverse("login"), credentials)
+        etag = self.client.get(self.url)["ETag"]
+        self.assertNotModified(self.url, etag, queries=3)
+
+        # A new login rotates the CSRF token the page embeds
+        self.client.get(reverse("logout"))
+        self.client.post(reverse("login"), credentials)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_index(self):
+        url = reverse("index")
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag)
+
+        # A new price changes a card, not the feed
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.buyer, 25)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "$ 25.00")
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_listing(self.seller, self.listing.category, title="New")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "New")
+        self.assertEqual(self.client.get(url, {"cat": "99"}).status_code, 400)
+
+
+@override_settings(AUCTIONS_COMMENTS_PAGE_SIZE=20)
+class CommentPaginationTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+        now = timezone.now()
+        Comment.objects.bulk_create([
+            Comment(author=self.seller if i % 10 == 0 else self.buyer,
+                    listing=self.listing, body=f"Comment {i}",
+                    created_at=now + timedelta(seconds=i))
+            for i in range(45)
+        ])
+
+    def bodies(self, html):
+        return [int(n) for n in re.findall(r"Comment (\d+)", html)]
+
+    def next_url(self, html):
+        match = re.search(r'href="([^"]*/comments\?cursor=[^"]*)"', html)
+        return match and match.group(1)
+
+    def test_first_page_inline_then_fragments(self):
+        html = self.client.get(reverse("listing", args=(self.listing.id,))
+                               ).content.decode()
+        self.assertEqual(self.bodies(html), list(range(44, 24, -1)))
+        self.assertEqual(html.count('<span class="badge">Author</span>'), 2)
+
+        url = self.next_url(html)
+        with self.assertNumQueries(2):
+            html = self.client.get(url).content.decode()
+        self.assertEqual(self.bodies(html), list(range(24, 4, -1)))
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        html = self.client.get(self.next_url(html)).content.decode()
+        self.assertEqual(self.bodies(html), [4, 3, 2, 1, 0])
+        self.assertIsNone(self.next_url(html))
+        self.assertNotIn("There are no comments yet.", html)
+
+    def test_fragment_conditional_and_errors(self):
+        url = reverse("listing-comments", args=(self.listing.id,))
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                         .status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(author=self.buyer, listing=self.listing,
+                                   body="Comment 45",
+                                   created_at=timezone.now() + timedelta(minutes=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Comment 45")
+
+        self.assertEqual(self.client.get(url, {"cursor": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse(
+            "listing-comments", args=(self.listing.id + 1,))).status_code, 404)
+
+
+class AsyncViewTests(ViewTestCase):
+    """The async pages never touch the database from the event loop, which
+    Django refuses with SynchronousOnlyOperation."""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        self.listing = create_listing(self.seller, self.category,
+                                      title="Robot")
+        Comment.objects.create(author=self.seller, listing=self.listing,
+                               body="Works fine", created_at=timezone.now())
+        self.buyer.watchlist.add(self.listing)
+
+    async def test_pages(self):
+        await self.async_client.aforce_login(self.buyer)
+        for url, text in (
+                (reverse("index"), "Robot"),
+                (reverse("index") + f"?cat={self.category.id}", "Robot"),
+                (reverse("listing", args=(self.listing.id,)), "Works fine"),
+                (reverse("categories"), "Toys"),
+                (reverse("watchlist"), "Robot")):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertContains(response, text)
+                self.assertContains(response, "buyer")
+        response = await self.async_client.get(
+            reverse("listing", args=(self.listing.id + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_and_anonymous(self):
+        url = reverse("listing", args=(self.listing.id,))
+        response = await self.async_client.get(url)
+        self.assertContains(response, "Works fine")
+        response = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse("watchlist"))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_bid_and_comment(self):
+        await self.async_client.aforce_login(self.buyer)
+        url = reverse("listing", args=(self.listing.id,))
+        response = await self.async_client.post(
+            url, {"add_bid": "Bid", "bid_ammount": "25"})
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.post(
+            url, {"send_comment": "Send", "comment_body": "Still available?"})
+        self.assertEqual(response.status_code, 302)
+        listing = await Listing.objects.aget(pk=self.listing.id)
+        self.assertEqual(listing.current_bid_amount, 25)
+        self.assertTrue(await Comment.objects.filter(
+            body="Still available?").aexists())
+        response = await self.async_client.post(
+            url, {"add_bid": "Bid", "bid_ammount": "20"})
+        self.assertContains(response, "Your bid has to be higher than the current bid.")
+
+    @contextmanager
+    def record_csrf_hooks(self):
+        hooks = []
+
+        def record(method):
+            def hook(instance, *args):
+                hooks.append((method.__qualname__, threading.current_thread()))
+                return method(instance, *args)
+            return hook
+
+        csrf = middleware.csrf.CsrfViewMiddleware
+        with mock.patch.object(csrf, "process_request",
+                               record(csrf.process_request)), \
+                mock.patch.object(csrf, "process_view",
+                                  record(csrf.process_view)), \
+                mock.patch.object(csrf, "process_response",
+                                  record(csrf.process_response)):
+            yield hooks
+
+    async def test_middleware_stays_on_the_event_loop(self):
+        loop_thread = threading.current_thread()
+        await self.async_client.aforce_login(self.buyer)
+        with self.record_csrf_hooks() as hooks:
+            response = await self.async_client.get(reverse("categories"))
+        self.assertContains(response, "Toys")
+        self.assertEqual([thread for _, thread in hooks], [loop_thread] * 3)
+
+    async def test_unsafe_requests_run_the_middleware_in_a_thread(self):
+        # The CSRF check of a POST reads its body
+        loop_thread = threading.current_thread()
+        with self.record_csrf_hooks() as hooks:
+            response = await self.async_client.post(
+                reverse("login"), {"username": "buyer", "password": "wrong"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(hooks), 3)
+        self.assertNotIn(loop_thread, [thread for _, thread in hooks])
+
+    async def test_login_saves_the_session(self):
+        # A changed session is saved through a thread
+        await sync_to_async(self.buyer.set_password)("secret")
+        await self.buyer.asave()
+        response = await self.async_client.post(
+            reverse("login"), {"username": "buyer", "password": "secret"})
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(reverse("watchlist"))
+        self.assertContains(response, "Robot")
+
+    async def test_in_process_cache_stays_on_the_event_loop(self):
+        caching.get_cache().set("key", "value")
+        with mock.patch.object(caching.get_cache(), "get_many",
+                               wraps=caching.get_cache().get_many) as get_many, \
+                mock.patch("asgiref.sync.SyncToAsync.__call__") as to_thread:
+            self.assertEqual(await caching.aget_cache().aget_many(["key"]),
+                             {"key": "value"})
+        get_many.assert_called_once_with(["key"])
+        to_thread.assert_not_called()
+
+
+class WatchlistDigestTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.seller = User.objects.create_user("seller", "seller@example.com")
+        self.alice = User.objects.create_user("alice", "alice@example.com")
+        self.bob = User.objects.create_user("bob", "bob@example.com")
+        category = Category.objects.create(title="Toys")
+        self.lamp = create_listing(self.seller, category, title="Lamp",
+                                   ends_at=self.now + timedelta(days=3))
+        self.clock = create_listing(self.seller, category, title="Clock",
+                                    ends_at=self.now + timedelta(hours=2))
+        self.chair = create_listing(self.seller, category, title="Chair",
+                                    ends_at=self.now + timedelta(hours=1))
+        place_bid(self.lamp.id, self.alice, 20)
+        place_bid(self.lamp.id, self.bob, 30)
+        place_bid(self.chair.id, self.alice, 15)
+        # Ended an hour ago
+        Listing.objects.filter(pk=self.chair.id).update(
+            ends_at=self.now - timedelta(hours=1))
+        Listing.objects.filter(pk=self.chair.id).close()
+        self.alice.watchlist.add(self.lamp, self.clock)
+        self.bob.watchlist.add(self.lamp)
+
+    def build(self):
+        return {digest.username: digest for digest in digests.build_digests(
+            now=self.now, chunk_size=1)}
+
+    def titles(self, items):
+        return [item["title"] for item in items]
+
+    def test_sections(self):
+        with self.assertNumQueries(2):
+            built = self.build()
+        self.assertEqual(sorted(built), ["alice"])
+        alice = built["alice"]
+        self.assertEqual(self.titles(alice.outbid), ["Lamp"])
+        self.assertEqual(alice.outbid[0]["price"], Decimal("30.00"))
+        self.assertEqual(self.titles(alice.closing_soon), ["Clock"])
+        self.assertEqual(self.titles(alice.won), ["Chair"])
+
+    def test_won_by_close_time(self):
+        category = self.lamp.category
+        closed_early = create_listing(self.seller, category, title="Desk",
+                                      ends_at=self.now + timedelta(days=5))
+        open_ended = create_listing(self.seller, category, title="Rug")
+        long_ago = create_listing(self.seller, category, title="Vase",
+                                  ends_at=self.now + timedelta(days=5))
+        listings = (closed_early, open_ended, long_ago)
+        for listing in listings:
+            place_bid(listing.id, self.bob, 20)
+        Listing.objects.filter(pk__in=[listing.id for listing in listings]
+                               ).close()
+        Listing.objects.filter(pk=long_ago.id).update(
+            closed_at=self.now - timedelta(days=2))
+        self.assertEqual(sorted(self.titles(self.build()["bob"].won)),
+                         ["Desk", "Rug"])
+
+        # Closing and reopening by an edit, as from the admin
+        open_ended.refresh_from_db()
+        open_ended.active = True
+        open_ended.save()
+        self.assertIsNone(open_ended.closed_at)
+        open_ended.active = False
+        open_ended.save()
+        self.assertIsNotNone(Listing.objects.get(pk=open_ended.id).closed_at)
+
+    def test_merges_users_in_order(self):
+        place_bid(self.clock.id, self.bob, 50)
+        place_bid(self.clock.id, self.alice, 60)
+        stats = digests.DigestStats()
+        built = list(digests.build_digests(now=self.now, stats=stats))
+        self.assertEqual([digest.username for digest in built],
+                         ["alice", "bob"])
+        self.assertEqual(self.titles(built[1].outbid), ["Clock"])
+        self.assertEqual(stats.digests, 2)
+        self.assertEqual(stats.rows, 4)
+
+    def test_command_with_file_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "digests.jsonl")
+            report = io.StringIO()
+            call_command("send_watchlist_digests",
+                         sink="auctions.digests.FileSink", output=path,
+                         stderr=report)
+            with open(path) as output:
+                lines = [json.loads(line) for line in output]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["email"], "alice@example.com")
+        self.assertEqual(lines[0]["outbid"][0]["price"], "30.00")
+        self.assertIn("1 digest(s) from 3 row(s)", report.getvalue())
+
+    def test_console_sink(self):
+        output = io.StringIO()
+        sink = digests.ConsoleSink(output)
+        for digest in self.build().values():
+            sink.write(digest)
+        self.assertIn("Outbid: Lamp ($30.00)", output.getvalue())
+        self.assertIn("Won: Chair", output.getvalue())
+
+
+
+@override_settings(AUCTIONS_RATE_LIMITS={
+    "write": (4, 60), "bid": (2, 60), "comment": (1, 60), "watchlist": (1, 60),
+})
+class RateLimitTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.listing = create_listing(self.seller,
+                                      Category.objects.create(title="Toys"))
+        self.url = reverse("listing", args=(self.listing.id,))
+
+    def bid(self, amount, client=None):
+        return (client or self.client).post(
+            self.url, {"add_bid": "Bid", "bid_ammount": str(amount)})
+
+    def test_token_bucket(self):
+        bucket, wait = ratelimit._take(None, 2, 60, now=100.0)
+        self.assertEqual((bucket, wait), ((1, 100.0), 0))
+        bucket, wait = ratelimit._take(bucket, 2, 60, now=100.0)
+        bucket, wait = ratelimit._take(bucket, 2, 60, now=100.0)
+        self.assertEqual(wait, 30)
+        # One token every 30 seconds, never more than the burst
+        self.assertEqual(ratelimit._take(bucket, 2, 60, now=130.0)[1], 0)
+        self.assertEqual(ratelimit._take(bucket, 2, 60, now=1000.0)[0][0], 1)
+
+    def test_bids_per_user(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.bid(20).status_code, 302)
+        self.assertEqual(self.bid(30).status_code, 302)
+        response = self.bid(40)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid_amount, 30)
+        # Comments have their own bucket, and other users their own
+        self.assertEqual(self.client.post(self.url, {
+            "send_comment": "Send", "comment_body": "Hi"}).status_code, 302)
+        other = self.client_class()
+        other.force_login(User.objects.create_user("other"))
+        self.assertEqual(self.bid(50, other).status_code, 302)
+        # Reading is never limited
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_watchlist_toggles(self):
+        self.client.force_login(self.buyer)
+        url = reverse("set-watchlist", args=(self.listing.id,))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        self.assertEqual(self.client.post(reverse(
+            "watchlist-api", args=(self.listing.id,))).status_code, 429)
+
+    def test_middleware_limits_writes_per_ip(self):
+        url = reverse("login")
+        data = {"username": "nobody", "password": "wrong"}
+        for _ in range(4):
+            self.assertEqual(self.client.post(url, data).status_code, 200)
+        self.assertEqual(self.client.post(url, data).status_code, 429)
+        self.assertEqual(self.client.post(
+            url, data, REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    @override_settings(AUCTIONS_RATE_LIMIT_BACKEND="auctions.ratelimit.CacheBackend")
+    def test_cache_backend(self):
+        self.client.force_login(self.buyer)
+        self.bid(20)
+        self.bid(30)
+        self.assertEqual(self.bid(40).status_code, 429)
+
+    async def test_async_view(self):
+        await self.async_client.aforce_login(self.buyer)
+        for amount, status in ((20, 302), (30, 302), (40, 429)):
+            response = await self.async_client.post(
+                self.url, {"add_bid": "Bid", "bid_ammount": str(amount)})
+            self.assertEqual(response.status_code, status)
+
+
+class UserSummaryTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+
+    def summary(self, user):
+        summary = UserSummary.objects.get(user=user)
+        return (summary.active_listings, summary.closed_listings,
+                summary.bids_received, summary.gross_sales,
+                summary.auctions_won)
+
+    def assertMatchesRebuild(self):
+        incremental = {user: self.summary(user)
+                       for user in User.objects.order_by("pk")}
+        call_command("rebuild_user_summaries", stdout=io.StringIO())
+        self.assertEqual(incremental, {user: self.summary(user)
+                                       for user in incremental})
+
+    def test_incremental_updates(self):
+        sold = create_listing(self.seller, self.category, price=10)
+        unsold = create_listing(self.seller, self.category, price=10)
+        create_listing(self.seller, self.category, price=10)
+        place_bid(sold.id, self.buyer, 20)
+        place_bid(sold.id, self.buyer, 25)
+        create_listing(self.buyer, self.category, price=5)
+        place_bid(Listing.objects.get(author=self.buyer).id, self.seller, 6)
+        self.assertEqual(self.summary(self.seller),
+                         (3, 0, 2, Decimal("0.00"), 0))
+
+        Listing.objects.filter(pk__in=[sold.id, unsold.id]).close()
+        self.assertEqual(self.summary(self.seller),
+                         (1, 2, 2, Decimal("25.00"), 0))
+        self.assertEqual(self.summary(self.buyer),
+                         (1, 0, 1, Decimal("0.00"), 1))
+        self.assertMatchesRebuild()
+
+    def test_concurrent_close_counts_once(self):
+        first = create_listing(self.seller, self.category, price=10)
+        second = create_listing(self.seller, self.category, price=10)
+        place_bid(second.id, self.buyer, 20)
+        with race_close(first):
+            Listing.objects.filter(pk__in=[first.id, second.id]).close()
+        # Only `second` is this close's, the other one counts `first`
+        self.assertEqual(self.summary(self.seller),
+                         (1, 1, 1, Decimal("20.00"), 0))
+        self.assertEqual(self.summary(self.buyer)[4], 1)
+
+    def test_saved_and_deleted_listings(self):
+        listing = create_listing(self.seller, self.category, price=10)
+        place_bid(listing.id, self.buyer, 20)
+        listing.refresh_from_db()
+        # Closed by an edit, as from the admin
+        listing.active = False
+        listing.winner = self.buyer
+        listing.save()
+        self.assertEqual(self.summary(self.seller),
+                         (0, 1, 1, Decimal("20.00"), 0))
+        self.assertEqual(self.summary(self.buyer)[4], 1)
+        self.assertMatchesRebuild()
+
+        listing.delete()
+        self.assertEqual(self.summary(self.seller)[:2], (0, 0))
+        self.assertEqual(self.summary(self.seller)[3], Decimal("0.00"))
+        self.assertEqual(self.summary(self.buyer)[4], 0)
+
+    def test_drifted_summary_does_not_block_closing(self):
+        listing = create_listing(self.seller, self.category)
+        UserSummary.objects.filter(user=self.seller).update(active_listings=0)
+        Listing.objects.filter(pk=listing.id).close()
+        self.assertEqual(self.summary(self.seller)[:2], (0, 1))
+
+    def test_missing_summary_is_rebuilt(self):
+        create_listing(self.seller, self.category)
+        UserSummary.objects.all().delete()
+        self.client.force_login(self.seller)
+        self.assertContains(self.client.get(reverse("my-listings")),
+                            "<strong>Active: </strong>1")
+
+    @override_settings(AUCTIONS_PAGE_SIZE=2)
+    def test_page_tabs_and_pagination(self):
+        now = timezone.now()
+        for i in range(5):
+            create_listing(self.seller, self.category, title=f"Item {i}",
+                           created_at=now + timedelta(seconds=i))
+        won = create_listing(self.buyer, self.category, title="Prize")
+        place_bid(won.id, self.seller, 30)
+        Listing.objects.filter(pk=won.id).close()
+        self.client.force_login(self.seller)
+
+        html = self.client.get(reverse("my-listings")).content.decode()
+        self.assertIn("<strong>Active: </strong>5", html)
+        self.assertIn("<strong>Auctions won: </strong>1", html)
+        self.assertEqual(re.findall(r">(Item \d)<", html), ["Item 4", "Item 3"])
+        titles = []
+        url = reverse("my-listings")
+        while url:
+            html = self.client.get(url).content.decode()
+            titles += re.findall(r">(Item \d)<", html)
+            match = re.search(r'href="([^"]*cursor=[^"]*)"', html)
+            url = match and match.group(1).replace("&amp;", "&")
+        self.assertEqual(titles, [f"Item {i}" for i in range(4, -1, -1)])
+
+        response = self.client.get(reverse("my-listings"), {"tab": "won"})
+        self.assertContains(response, "Prize")
+        self.assertNotContains(response, "Item 4")
+        self.assertEqual(self.client.get(reverse("my-listings"), {
+            "tab": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("my-listings"), {
+            "cursor": "nope"}).status_code, 400)
+
+
+class ApiTests(ViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user("buyer")
+        self.category = Category.objects.create(title="Toys")
+        now = timezone.now()
+        self.listings = [
+            create_listing(self.seller, self.category, title=f"Item {i}",
+                           created_at=now + timedelta(seconds=i))
+            for i in range(5)
+        ]
+        self.listing = self.listings[-1]
+        place_bid(self.listing.id, self.buyer, Decimal("12.50"))
+
+    def test_listings_keyset_pages(self):
+        url = reverse("api-listings")
+        titles = []
+        params = {"limit": 2}
+        while True:
+            with self.assertNumQueries(1):
+                data = self.client.get(url, params).json()
+            titles += [listing["title"] for listing in data["listings"]]
+            if data["next_cursor"] is None:
+                break
+            params["cursor"] = data["next_cursor"]
+        self.assertEqual(titles, [f"Item {i}" for i in range(4, -1, -1)])
+
+        first = self.client.get(url, {"limit": 1}).json()["listings"][0]
+        self.assertEqual(first["price"], "12.50")
+        self.assertEqual(first["seller"], "seller")
+        self.assertTrue(first["created_at"].endswith("Z"))
+        self.assertEqual(self.client.get(url, {"cat": self.category.id + 1}
+                                         ).json()["listings"], [])
+
+    def test_field_selection(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("api-listings"), {
+                "fields": "title,price", "limit": 1}).json()
+        self.assertEqual(data["listings"], [{"title": "Item 4",
+                                             "price": "12.50"}])
+        # Only those columns, plus the sort key the cursor needs
+        self.assertNotIn("description", queries[0]["sql"])
+        self.assertNotIn("auctions_user", queries[0]["sql"])
+
+        data = self.client.get(reverse("api-listing", args=(self.listing.id,)),
+                               {"fields": "description,leader"}).json()
+        self.assertEqual(data, {"description": "Description",
+                                "leader": "buyer"})
+        response = self.client.get(reverse("api-listings"),
+                                   {"fields": "title,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+
+    def test_detail_bids_and_categories(self):
+        data = self.client.get(reverse("api-listing",
+                                       args=(self.listing.id,))).json()
+        self.assertEqual(data["bid_count"], 2)
+        self.assertTrue(data["active"])
+        self.assertIsNone(data["won_by"])
+        self.assertEqual(self.client.get(reverse(
+            "api-listing", args=(self.listing.id + 1,))).status_code, 404)
+
+        data = self.client.get(reverse("api-listing-bids",
+                                       args=(self.listing.id,)),
+                               {"fields": "amount,bidder"}).json()
+        self.assertEqual(data["bids"], [
+            {"amount": "10.00", "bidder": "seller"},
+            {"amount": "12.50", "bidder": "buyer"},
+        ])
+        self.assertEqual(self.client.get(reverse("api-listing-bids", args=(
+            self.listing.id,)), {"cursor": "nope"}).status_code, 400)
+
+        data = self.client.get(reverse("api-categories")).json()
+        self.assertEqual(data["categories"], [
+            {"id": self.category.id, "title": "Toys", "active_count": 5}])
+
+    def test_errors(self):
+        url = reverse("api-listings")
+        for params in ({"limit": "0"}, {"limit": "x"}, {"cursor": "nope"},
+                       {"cat": "toys"}, {"cat": "\u00b2"}, {"cat": "\u0663"},
+                       {"cat": "9" * 30}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_compression(self):
+        url = reverse("api-listings")
+        plain = self.client.get(url)
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        response = self.client.get(url, headers={
+            "Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotIn("Content-Encoding", self.client.get(url, headers={
+            "Accept-Encoding": "gzip;q=0"}))
+        # Too small to be worth it
+        self.assertNotIn("Content-Encoding", self.client.get(
+            reverse("api-listing", args=(self.listing.id,)),
+            {"fields": "id"}, headers={"Accept-Encoding": "gzip"}))
+
+    @unittest.skipIf(api.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        url = reverse("api-listings")
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(api.brotli.decompress(response.content),
+                         self.client.get(url).content)
+
+    def test_encoders_agree(self):
+        data = {"price": Decimal("1.50"), "at": datetime(
+            2026, 1, 2, 3, 4, 5, 600000, tzinfo=dt_timezone.utc), "n": None}
+        expected = b'{"price":"1.50","at":"2026-01-02T03:04:05.600000Z","n":null}'
+        self.assertEqual(api.dumps(data), expected)
+        with mock.patch.object(api, "orjson", None):
+            self.assertEqual(api.dumps(data), expected)
 
-# Create your tests here.
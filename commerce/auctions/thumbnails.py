@@ -0,0 +1,306 @@
+"""Thumbnails of listing images, fetched once and cached on disk.
+
+Thumbnails are stored by the SHA-256 of their bytes under `blobs/`, and
+`keys/` maps a (source URL, size) pair to the blob, so listings sharing
+an image share its thumbnails. The source URL's hash is part of the
+thumbnail URL, which makes every thumbnail URL immutable: a new image
+URL means a new thumbnail URL. When the blobs outgrow
+AUCTIONS_THUMBNAIL_CACHE_BYTES the least recently served are deleted;
+serving one refreshes its modification time. Failed fetches are
+remembered under `failures/` for AUCTIONS_THUMBNAIL_FAILURE_TTL seconds,
+so a broken or slow image URL is not fetched again on every request.
+
+Images are fetched by the callable named in AUCTIONS_THUMBNAIL_FETCHER,
+and only raster images are accepted: every thumbnail is decoded and
+re-encoded as JPEG with Pillow, so nothing the seller's URL returns is
+ever served as is. `fetch_url` only connects to public addresses, on
+redirects too, so listing URLs can't reach the server's own network.
+"""
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from PIL import Image
+
+# Bounding boxes of the thumbnail sizes, in pixels
+SIZES = {
+    "small": (120, 120),
+    "card": (300, 300),
+    "large": (600, 600),
+}
+
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Content types of the images thumbnails are made of, and their Pillow formats
+RASTER_TYPES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/gif": "GIF",
+    "image/webp": "WEBP",
+}
+
+
+class FetchError(Exception):
+    pass
+
+
+def check_address(address):
+    """Raise FetchError unless `address` is a public IP address."""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # Not global covers private, loopback, link-local and reserved ranges
+    if not ip.is_global or ip.is_multicast:
+        raise FetchError(f"Address not allowed: {address}")
+
+
+def check_url(url):
+    """Raise FetchError unless `url` is http(s) on a host with public addresses."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"Unsupported URL: {url!r}")
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or None,
+                                       proto=socket.IPPROTO_TCP)
+    except (OSError, ValueError) as exc:
+        raise FetchError(str(exc)) from exc
+    for *_, sockaddr in addresses:
+        check_address(sockaddr[0])
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    """Checks the address actually connected to, as DNS may have changed
+    since `check_url`."""
+
+    def connect(self):
+        super().connect()
+        check_address(self.sock.getpeername()[0])
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        super().connect()
+        check_address(self.sock.getpeername()[0])
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req,
+                            context=self._context)
+
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies, which would hide the address connected to
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler,
+    _PublicRedirectHandler)
+
+
+def fetch_url(url):
+    """Return the (bytes, content type) of a raster image at a public
+    http(s) URL."""
+    check_url(url)
+    request = urllib.request.Request(url, headers={"User-Agent": "commerce"})
+    try:
+        with _opener.open(request, timeout=5) as response:
+            content_type = response.headers.get_content_type()
+            data = response.read(MAX_SOURCE_BYTES + 1)
+    except OSError as exc:
+        raise FetchError(str(exc)) from exc
+    if content_type not in RASTER_TYPES:
+        raise FetchError(f"Not a supported image: {content_type}")
+    if len(data) > MAX_SOURCE_BYTES:
+        raise FetchError("Image too large")
+    return data, content_type
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+def resize(data, content_type, size):
+    """Return the (bytes, content type) of the image shrunk to fit `size`.
+
+    The image must decode as one of the RASTER_TYPES, whatever else it
+    claims to be; the result is always a new JPEG.
+    """
+    if content_type not in RASTER_TYPES:
+        raise FetchError(f"Not a supported image: {content_type}")
+    try:
+        image = Image.open(io.BytesIO(data),
+                           formats=list(RASTER_TYPES.values()))
+        image.thumbnail(SIZES[size])
+        output = io.BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=85, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise FetchError(f"Not a readable image: {exc}") from exc
+    return output.getvalue(), "image/jpeg"
+
+
+# Bytes of blobs under each cache root, as counted by the last walk plus
+# what this process wrote since. Blobs written by other processes are
+# only counted at the next walk, so the cache may outgrow max_bytes by as
+# much until then
+_blob_bytes = {}
+_blob_bytes_lock = threading.Lock()
+
+# Eviction frees room down to this share of max_bytes, so that the blobs
+# are not walked again on every write once the cache is full
+EVICT_TO = 0.9
+
+
+class ThumbnailCache:
+    """The content-addressed thumbnails under `root`, at most `max_bytes`."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _key_path(self, source_hash, size):
+        return os.path.join(self.root, "keys", f"{source_hash}-{size}")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _failure_path(self, source_hash, size):
+        return os.path.join(self.root, "failures", f"{source_hash}-{size}")
+
+    def failed_recently(self, source_hash, size, ttl):
+        """Whether fetching this thumbnail failed less than `ttl` seconds ago."""
+        try:
+            failed_at = os.stat(self._failure_path(source_hash, size)).st_mtime
+        except OSError:
+            return False
+        return time.time() - failed_at < ttl
+
+    def put_failure(self, source_hash, size):
+        _write_atomic(self._failure_path(source_hash, size), b"")
+
+    def get(self, source_hash, size):
+        """Return (path, digest, content type) of a cached thumbnail, or None."""
+        try:
+            with open(self._key_path(source_hash, size)) as key_file:
+                digest, content_type = key_file.read().split()
+            if content_type not in RASTER_TYPES:
+                return None
+            path = self._blob_path(digest)
+            # Mark it recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return path, digest, content_type
+
+    def put(self, source_hash, size, data, content_type):
+        """Store a thumbnail and return (path, digest, content type)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        written = 0
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+            written = len(data)
+        _write_atomic(self._key_path(source_hash, size),
+                      f"{digest} {content_type}".encode())
+        with _blob_bytes_lock:
+            total = _blob_bytes.get(self.root)
+            if total is not None:
+                total = _blob_bytes[self.root] = total + written
+        if total is None or total > self.max_bytes:
+            self.evict(keep=path)
+        return path, digest, content_type
+
+    def evict(self, keep=None):
+        """Delete the least recently used blobs if they don't fit in
+        max_bytes, down to EVICT_TO of it."""
+        blobs = []
+        total = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "blobs")):
+            for name in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size,
+                              os.path.join(dirpath, name)))
+                total += stat.st_size
+        blobs.sort()
+        # Keys left pointing at deleted blobs count as misses
+        if total > self.max_bytes:
+            for _, blob_size, path in blobs:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= blob_size
+        with _blob_bytes_lock:
+            _blob_bytes[self.root] = total
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_cache():
+    return ThumbnailCache(settings.AUCTIONS_THUMBNAIL_DIR,
+                          settings.AUCTIONS_THUMBNAIL_CACHE_BYTES)
+
+
+def get_thumbnail(source_hash, size, load_url):
+    """Return (path, digest, content type) of a thumbnail, making it on a miss.
+
+    `load_url()` returns the source URL. Returns None if it is unknown or
+    no longer matches `source_hash`, and raises FetchError if the image
+    can't be fetched or read, now or within the failure TTL.
+    """
+    cache = get_cache()
+    cached = cache.get(source_hash, size)
+    if cached is not None:
+        return cached
+    if cache.failed_recently(source_hash, size,
+                             settings.AUCTIONS_THUMBNAIL_FAILURE_TTL):
+        raise FetchError("Fetching the image failed recently")
+    url = load_url()
+    if url is None or url_hash(url) != source_hash:
+        return None
+    fetch = import_string(settings.AUCTIONS_THUMBNAIL_FETCHER)
+    try:
+        data, content_type = resize(*fetch(url), size)
+    except FetchError:
+        cache.put_failure(source_hash, size)
+        raise
+    return cache.put(source_hash, size, data, content_type)
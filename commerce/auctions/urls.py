@@ -1,18 +1,32 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("categories/", views.categories_view, name="categories"),
+    path("search", views.search_view, name="search"),
     path("login/", views.login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
     path("register/", views.register, name="register"),
     path("create/", views.create_listing, name="create-listing"),
     path("listing/<int:pk>", views.listing_view, name="listing"),
+    path("listing/<int:pk>/events", views.listing_events, name="listing-events"),
+    path("listing/<int:pk>/comments", views.listing_comments, name="listing-comments"),
+    path("listing/<int:pk>/history", views.listing_history, name="listing-history"),
+    path("listing/<int:pk>/thumbnail/<slug:size>/<slug:source_hash>",
+         views.listing_thumbnail, name="listing-thumbnail"),
     path("close/<int:pk>", views.close_listing, name="close"),
     path("mylistings/", views.my_listings, name="my-listings"),
     path("watchlist/", views.watchlist, name="watchlist"),
+    path("watchlist/<int:listing_id>", views.watchlist_api, name="watchlist-api"),
     path("set_watchlist/<int:listing_id>",
          views.watchlist_item, name="set-watchlist"),
+    path("cache-stats/", views.cache_stats_view, name="cache-stats"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("api/v1/listings", api.listings, name="api-listings"),
+    path("api/v1/listings/<int:pk>", api.listing, name="api-listing"),
+    path("api/v1/listings/<int:pk>/bids", api.listing_bids,
+         name="api-listing-bids"),
+    path("api/v1/categories", api.categories, name="api-categories"),
 ]
@@ -1,27 +1,164 @@
-from datetime import datetime
-
+import asyncio
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.db import IntegrityError
-from django.db.models import Max
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseBadRequest, HttpResponseNotModified,
+                         HttpResponseRedirect, JsonResponse, StreamingHttpResponse)
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
-
-from .models import User, Listing, Bid, Comment, Category
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_cookie
+from django.utils import timezone
+
+from . import caching, events, history, metrics, search, thumbnails
+from .ratelimit import rate_limit
+from .models import User, Listing, Bid, Comment
 from .forms import CreateListingForm
-
-
-def index(request):
+from .bidding import BidStatus, place_bid
+from .categories import acatalogue
+from .pagination import apaginate_newest_first, paginate_newest_first
+from .stats import user_summary
+from .watchlist import ais_watching, is_watching, set_watching, watcher_count
+
+BID_MESSAGES = {
+    BidStatus.OUTBID: "Your bid has to be higher than the current bid.",
+    BidStatus.CLOSED: "This listing is closed.",
+    BidStatus.SELF_BID: "You can't bid on your own listing.",
+    BidStatus.NOT_FOUND: "This listing does not exist.",
+}
+
+
+# The index, listing, categories and watchlist pages are async views: under
+# ASGI they wait on the cache and the database without holding a thread.
+# The ORM still runs each query in a worker thread, one per request, so
+# gathered queries overlap with each other's cache lookups and with other
+# requests rather than with each other.
+
+async def _auser(request):
+    """Resolve `request.user` without blocking, once per request.
+
+    The lazy `request.user` would hit the database from the event loop
+    when the templates touch it.
+    """
+    if not hasattr(request, "_auser_resolved"):
+        request.user = await request.auser()
+        request._auser_resolved = True
+    return request.user
+
+
+def _acondition(etag_func):
+    """`condition(etag_func=...)` for async views whose ETag is awaited."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ("GET", "HEAD"):
+                response.headers.setdefault("ETag", etag)
+            return response
+        return inner
+    return decorator
+
+
+async def _aindex_page(request):
+    """Return the listing ids, next cursor, categories and loaded listings
+    of the index page asked for, computed once per request.
+
+    Raises ValueError for an unknown category or a bad cursor.
+    """
+    if hasattr(request, "_index_page"):
+        return request._index_page
     cat = request.GET.get('cat')
-    if cat is not None:
-        listings = Listing.objects.annotate(
-            max_bid=Max("bids__ammount")).order_by('-created_at').filter(category=cat)
-    else:
-        listings = Listing.objects.annotate(
-            max_bid=Max("bids__ammount")).order_by('-created_at')
+    cursor = request.GET.get('cursor')
+    page_size = settings.AUCTIONS_PAGE_SIZE
+    loaded = {}
+    categories = await acatalogue()
+    if cat is not None and cat not in {str(c["id"]) for c in categories}:
+        raise ValueError(f"Unknown category: {cat!r}")
+
+    async def load_page():
+        listings = Listing.objects.filter(active=True).select_related('author')
+        if cat is not None:
+            listings = listings.filter(category=cat)
+        page = await apaginate_newest_first(listings, cursor=cursor,
+                                            page_size=page_size)
+        loaded.update((listing.id, listing) for listing in page.items)
+        return [listing.id for listing in page.items], page.next_cursor
+
+    listing_ids, next_cursor = await caching.acached_feed_page(
+        cat, cursor, page_size, load_page)
+    request._index_page = listing_ids, next_cursor, categories, loaded
+    return request._index_page
+
+
+def _personal_etag(request, token, *extra):
+    # Pages show who is logged in, so each user gets their own ETag. Their
+    # forms embed the CSRF token, which is rotated at login, so its secret
+    # counts too (made now if missing, as rendering would)
+    if not request.user.is_authenticated:
+        return token
+    get_token(request)
+    csrf = hashlib.sha1(request.META["CSRF_COOKIE"].encode()).hexdigest()[:8]
+    return "-".join([token, str(request.user.pk), *map(str, extra), csrf])
+
+
+async def _index_etag(request):
+    await _auser(request)
+    try:
+        listing_ids, _, _, _ = await _aindex_page(request)
+    except ValueError:
+        return None
+    return _personal_etag(request, await caching.aversion_token(
+        listing_ids, feed=True, categories=True))
+
+
+# Answered with 304 Not Modified from the ETag alone when nothing changed,
+# before any query or rendering; the pages are per user, so only browsers
+# may cache them and they must revalidate each time
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
+@_acondition(_index_etag)
+async def index(request):
+    try:
+        listing_ids, next_cursor, categories, loaded = await _aindex_page(
+            request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid category or cursor.")
+
+    async def load_cards(listing_ids):
+        listings = [loaded[pk] for pk in listing_ids if pk in loaded]
+        if len(listings) < len(listing_ids):
+            listings = [listing async for listing in Listing.objects.filter(
+                pk__in=listing_ids).select_related('author')]
+        return {listing.id: render_to_string("auctions/listing_card.html", {
+            "listing": listing,
+        }) for listing in listings}
+
     return render(request, "auctions/index.html", {
-        "listings": listings
+        "cards": await caching.acached_cards(listing_ids, load_cards),
+        "next_cursor": next_cursor,
+        "cat": request.GET.get('cat'),
+        "categories": categories,
     })
 
 # LISTINGS
@@ -33,16 +170,17 @@ def create_listing(request):
         form = CreateListingForm(request.POST)
         if form.is_valid():
             # Get the current time
-            now = datetime.now()
+            now = timezone.now()
             # Save Listing object
             new_listing = Listing(
                 active=True,
                 author=request.user,
                 created_at=now,
+                ends_at=now + timedelta(days=form.cleaned_data["duration"]),
                 title=form.cleaned_data["title"],
                 description=form.cleaned_data["description"],
                 img_url=form.cleaned_data["img_url"],
-                category=form.cleaned_data["category"],
+                category_id=form.cleaned_data["category"],
             )
             new_listing.save()
             # Save Bid object
@@ -68,105 +206,328 @@ def create_listing(request):
     })
 
 
-def listing_view(request, pk):
-    listing = Listing.objects.get(pk=pk)
-    comments = Comment.objects.filter(listing=listing).order_by('-created_at')
-    current_bid = Bid.objects.filter(
-        listing=listing).order_by('-ammount').first()
-    total_bids = len(Bid.objects.filter(
-        listing=listing))
-    in_watchlist = True if request.user in listing.watchers.all() else False
-    if request.user.is_authenticated:
-        has_user_bid = True if Bid.objects.filter(
-            listing=listing).filter(user=request.user).exists() else False
-    else:
-        has_user_bid = False
+async def _ain_watchlist(request, pk):
+    user = await _auser(request)
+    if not user.is_authenticated:
+        return False
+    if not hasattr(request, "_in_watchlist"):
+        request._in_watchlist = await ais_watching(user, pk)
+    return request._in_watchlist
+
+
+async def _listing_etag(request, pk):
+    if request.method not in ("GET", "HEAD"):
+        return None
+    # The version lookup and the watch state are independent
+    token, in_watchlist = await asyncio.gather(
+        caching.aversion_token([pk]), _ain_watchlist(request, pk))
+    return _personal_etag(request, token, int(in_watchlist))
+
 
+def _listing_action(request):
+    if request.method == "POST":
+        if 'add_bid' in request.POST:
+            return "bid"
+        if 'send_comment' in request.POST:
+            return "comment"
+    return None
+
+
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
+@_acondition(_listing_etag)
+@rate_limit(_listing_action)
+async def listing_view(request, pk):
+    message = None
+    user = await _auser(request)
     if request.method == "POST":
         # Check if the user is authenticated
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             return redirect(reverse('login'))
         # Bid
         if 'add_bid' in request.POST:
-            # Check if the bid is higher than the current
-            bid_ammount = request.POST["bid_ammount"]
-            if float(bid_ammount) <= current_bid.ammount:
-                return render(request, "auctions/listing.html", {
-                    "listing": listing,
-                    "current_bid": current_bid,
-                    "total_bids": total_bids,
-                    "has_user_bid": has_user_bid,
-                    "in_watchlist": in_watchlist,
-                    "comments": comments,
-                    "message": "Your bid has to be higher than the current bid."
-                })
-            # Create a bid with the new ammount
+            try:
+                bid_ammount = Decimal(request.POST["bid_ammount"])
+            except InvalidOperation:
+                bid_ammount = None
+            # Must fit the column: finite, at most two decimal places and
+            # ten integer digits
+            if bid_ammount is None or not bid_ammount.is_finite() or (
+                    bid_ammount.as_tuple().exponent < -2
+                    or bid_ammount.adjusted() >= 10):
+                message = "Please enter a valid bid."
             else:
-                now = datetime.now()
-                new_bid = Bid(
-                    user=request.user,
-                    listing=listing,
-                    ammount=float(bid_ammount),
-                    created_at=now
-                )
-                new_bid.save()
-            # Redirect to listing page
-                return HttpResponseRedirect(reverse('listing', kwargs={"pk": pk}))
+                # Check and save the bid in a single transaction
+                result = await sync_to_async(place_bid)(pk, user, bid_ammount)
+                if result.accepted:
+                    return HttpResponseRedirect(reverse('listing', kwargs={"pk": pk}))
+                message = BID_MESSAGES[result.status]
         # Comment
         elif 'send_comment' in request.POST:
             comment_body = request.POST["comment_body"]
             new_comment = Comment(
-                author=request.user,
-                listing=listing,
+                author=user,
+                listing_id=pk,
                 body=comment_body,
-                created_at=datetime.now()
+                created_at=timezone.now()
             )
-            new_comment.save()
+            await new_comment.asave()
             return HttpResponseRedirect(reverse('listing', kwargs={"pk": pk}))
 
-    # GET
+    # The listing and its comments are the same for everyone, so they come
+    # from the cache; only the watch state is looked up per user
+    page, in_watchlist = await asyncio.gather(
+        caching.acached_listing_page(pk, lambda: _aload_listing_page(pk)),
+        _ain_watchlist(request, pk))
     return render(request, "auctions/listing.html", {
-        "listing": listing,
-        "current_bid": current_bid,
-        "total_bids": total_bids,
-        "has_user_bid": has_user_bid,
+        "listing": page["listing"],
+        "comments_html": page["comments_html"],
         "in_watchlist": in_watchlist,
-        "comments": comments,
+        "message": message,
+    })
+
+
+async def listing_events(request, pk):
+    # An endless stream would tie up a WSGI worker for good
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live events need the ASGI server.", status=501)
+    # Browsers reconnect a lot, so this mostly hits the cache
+    if not await caching.acached_listing_exists(
+            pk, Listing.objects.filter(pk=pk).aexists):
+        raise Http404("No such listing.")
+
+    async def stream():
+        # The middleware is done with the request once the body streams,
+        # so idle streams hold no thread or connection
+        await events.release_request_thread()
+        subscription = events.get_broker().subscribe(events.listing_channel(pk))
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await subscription.get(
+                        timeout=settings.AUCTIONS_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind, the browser reconnects
+                    return
+                yield events.format_sse(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def listing_history(request, pk):
+    """Bid history of a listing as JSON, or OHLC buckets with ?interval=."""
+    try:
+        limit = min(int(request.GET.get('limit', 100)), 1000)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit."}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Invalid limit."}, status=400)
+    if not Listing.objects.filter(pk=pk).exists():
+        return JsonResponse({"error": "No such listing."}, status=404)
+    cursor = request.GET.get('cursor')
+    interval = request.GET.get('interval')
+    try:
+        if interval:
+            buckets, next_cursor = history.ohlc_buckets(pk, interval,
+                                                        cursor, limit)
+            return JsonResponse({
+                "listing_id": pk,
+                "interval": interval,
+                "buckets": buckets,
+                "next_cursor": next_cursor,
+            })
+        page = history.bid_page(pk, cursor, limit)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse({
+        "listing_id": pk,
+        "bids": page.items,
+        "next_cursor": page.next_cursor,
+    })
+
+
+def listing_thumbnail(request, pk, size, source_hash):
+    """Serve a resized, disk-cached copy of a listing's image.
+
+    Thumbnail URLs embed a hash of the image URL, so they never change
+    content and can be cached by browsers for good.
+    """
+    if size not in thumbnails.SIZES:
+        raise Http404("Unknown thumbnail size.")
+
+    def load_url():
+        return Listing.objects.filter(pk=pk).values_list(
+            "img_url", flat=True).first()
+
+    try:
+        thumbnail = thumbnails.get_thumbnail(source_hash, size, load_url)
+    except thumbnails.FetchError:
+        response = HttpResponse("Image unavailable.", status=502)
+        # Browsers needn't ask again before the server would try again
+        response["Cache-Control"] = \
+            f"max-age={settings.AUCTIONS_THUMBNAIL_FAILURE_TTL}"
+        return response
+    if thumbnail is None:
+        raise Http404("No such image.")
+    path, digest, content_type = thumbnail
+
+    etag = f'"{digest}"'
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    # Never let a browser run anything it might take the image for
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Content-Security-Policy"] = "default-src 'none'"
+    return response
+
+
+def _comments(pk):
+    # Authors, and whether they are the seller, come in the same query
+    return Comment.objects.filter(listing_id=pk).select_related(
+        'author').annotate(by_seller=ExpressionWrapper(
+            Q(author=F('listing__author')), output_field=BooleanField()))
+
+
+def _render_comment_page(pk, page, cursor):
+    return render_to_string("auctions/listing_comment_page.html", {
+        "listing_id": pk,
+        "comments": page.items,
+        "next_cursor": page.next_cursor,
+        "first_page": cursor is None,
+    })
+
+
+def _render_comments_page(pk, cursor=None):
+    """Render a batch of a listing's comments, newest first.
+
+    Raises ValueError for an invalid cursor.
+    """
+    page = paginate_newest_first(
+        _comments(pk), cursor=cursor,
+        page_size=settings.AUCTIONS_COMMENTS_PAGE_SIZE)
+    return _render_comment_page(pk, page, cursor)
+
+
+async def _arender_comments_page(pk, cursor=None):
+    page = await apaginate_newest_first(
+        _comments(pk), cursor=cursor,
+        page_size=settings.AUCTIONS_COMMENTS_PAGE_SIZE)
+    return _render_comment_page(pk, page, cursor)
+
+
+def _comments_etag(request, pk):
+    return caching.version_token([pk])
+
+
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=_comments_etag)
+def listing_comments(request, pk):
+    """A later batch of comments, loaded by the listing page on demand."""
+    cursor = request.GET.get('cursor')
+
+    def build():
+        if not Listing.objects.filter(pk=pk).exists():
+            raise Http404("No such listing.")
+        return _render_comments_page(pk, cursor)
+
+    try:
+        html = caching.cached_comments_page(pk, cursor, build)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor.")
+    return HttpResponse(html)
+
+
+async def _aload_listing_page(pk):
+    # The listing, with its top bidder, and the first batch of comments are
+    # fetched together; the page loads later batches from listing_comments
+    try:
+        listing, first_page_html = await asyncio.gather(
+            Listing.objects.select_related(
+                'author', 'current_bidder', 'winner').aget(pk=pk),
+            _arender_comments_page(pk))
+    except Listing.DoesNotExist:
+        raise Http404("No such listing.")
+    return {
+        "listing": listing,
+        "comments_html": render_to_string("auctions/listing_comments.html", {
+            "first_page_html": first_page_html,
+        }),
+    }
+
+
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    cat = request.GET.get('cat') or None
+    # Active listings only, unless asked otherwise
+    active = None if request.GET.get('include_closed') else True
+    try:
+        results = search.search(query, category=cat, active=active,
+                                limit=settings.AUCTIONS_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid category.")
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "results": results,
     })
 
 
-def categories_view(request):
-    categories = Category.objects.all()
+async def categories_view(request):
+    await _auser(request)
     return render(request, 'auctions/categories.html', {
-        "categories": categories,
+        "categories": await acatalogue(),
     })
 
 
+# Tabs of the "My listings" page, and their listings
+MY_LISTINGS_TABS = {
+    "active": lambda user: Listing.objects.filter(author=user, active=True),
+    "closed": lambda user: Listing.objects.filter(
+        author=user, active=False).select_related('winner'),
+    "won": lambda user: Listing.objects.filter(
+        winner=user, active=False).select_related('author'),
+}
+
+
 @login_required(login_url="login")
 def my_listings(request):
-    listings = Listing.objects.annotate(
-        max_bid=Max("bids__ammount")).order_by('-created_at').filter(author=request.user)
-    won_listings = []  # TODO
-    for closed_listing in Listing.objects.annotate(
-            max_bid=Max("bids__ammount")).order_by('-created_at').filter(active=False).exclude(author=request.user):
-        highest_bid = Bid.objects.filter(
-            listing=closed_listing).order_by('-ammount').first()
-        if highest_bid.user == request.user:
-            won_listings.append(closed_listing)
-
-    print(f"DEBUG: Won listings: {won_listings}")
+    # Totals come from the precomputed summary, only the tab shown is
+    # queried, a page at a time
+    tab = request.GET.get('tab', 'active')
+    if tab not in MY_LISTINGS_TABS:
+        return HttpResponseBadRequest("Invalid tab.")
+    try:
+        page = paginate_newest_first(
+            MY_LISTINGS_TABS[tab](request.user),
+            cursor=request.GET.get('cursor'),
+            page_size=settings.AUCTIONS_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor.")
     return render(request, "auctions/mylistings.html", {
-        "listings": listings,
-        "won_listings": won_listings,
+        "summary": user_summary(request.user),
+        "tab": tab,
+        "listings": page.items,
+        "next_cursor": page.next_cursor,
     })
 
 
 @login_required(login_url="login")
 def close_listing(request, pk):
-    listing = Listing.objects.get(pk=pk)
+    listing = Listing.objects.select_related('author').get(pk=pk)
     if request.method == "POST" and request.user == listing.author:
-        listing.active = False
-        listing.save()
+        Listing.objects.filter(pk=pk).close()
         return HttpResponseRedirect(reverse('listing', kwargs={"pk": pk}))
     return render(request, 'auctions/close.html', {
         "listing": listing
@@ -175,25 +536,62 @@ def close_listing(request, pk):
 # WATCHLIST
 
 
+@login_required(login_url="login")
+@rate_limit("watchlist")
 def watchlist_item(request, listing_id):
-    listing = Listing.objects.get(pk=listing_id)
-    if request.user in listing.watchers.all():
-        request.user.watchlist.remove(listing)
-    else:
-        request.user.watchlist.add(listing)
-    print(f"Watchlist: {request.user.watchlist}")
-
+    watching = is_watching(request.user, listing_id)
+    set_watching(request.user, listing_id, not watching)
     return HttpResponseRedirect(reverse('listing', args=(listing_id, )))
 
 
-def watchlist(request):
-    watched_listings = request.user.watchlist.all()
-    print(f"DEBUG: {watched_listings}")
+@require_POST
+@rate_limit("watchlist")
+def watchlist_api(request, listing_id):
+    """Set (or toggle, without a body) the watch on a listing, as JSON."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required."}, status=401)
+    try:
+        watching = json.loads(request.body or "{}").get("watching")
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+    if watching is not None and not isinstance(watching, bool):
+        return JsonResponse({"error": "'watching' must be a boolean."},
+                            status=400)
+    if not Listing.objects.filter(pk=listing_id).exists():
+        return JsonResponse({"error": "No such listing."}, status=404)
+    if watching is None:
+        watching = not is_watching(request.user, listing_id)
+    set_watching(request.user, listing_id, watching)
+    return JsonResponse({
+        "listing_id": listing_id,
+        "watching": watching,
+        "watchers": watcher_count(listing_id),
+    })
+
+
+@login_required(login_url="login")
+async def watchlist(request):
+    user = await _auser(request)
+    watched_listings = [listing async for listing in user.watchlist.filter(
+        active=True).select_related('author').order_by('-created_at')]
     return render(request, 'auctions/watchlist.html', {
         'watched_listings': watched_listings
     })
 
 
+@staff_member_required
+def cache_stats_view(request):
+    return JsonResponse(caching.cache_stats())
+
+
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse({
+        "views": metrics.snapshot(),
+        "cache": caching.cache_stats(),
+    })
+
+
 # LOGIN
 
 
@@ -0,0 +1,30 @@
+"""Watchlist membership, read and written through the User.watchlist table.
+
+Every operation is a single indexed query on the through table, so the
+cost doesn't depend on how many users watch a listing.
+"""
+from .models import User
+
+Watch = User.watchlist.through
+
+
+def is_watching(user, listing_id):
+    return Watch.objects.filter(user_id=user.pk, listing_id=listing_id).exists()
+
+
+async def ais_watching(user, listing_id):
+    return await Watch.objects.filter(user_id=user.pk,
+                                      listing_id=listing_id).aexists()
+
+
+def set_watching(user, listing_id, watching):
+    """Add or remove the watch; doing it twice changes nothing."""
+    if watching:
+        Watch.objects.bulk_create([Watch(user_id=user.pk, listing_id=listing_id)],
+                                  ignore_conflicts=True)
+    else:
+        Watch.objects.filter(user_id=user.pk, listing_id=listing_id).delete()
+
+
+def watcher_count(listing_id):
+    return Watch.objects.filter(listing_id=listing_id).count()
@@ -3,6 +3,10 @@ ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn commerce.asgi:application``)
+to enable the live listing events at ``/listing/<pk>/events``, which
+are not available under WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
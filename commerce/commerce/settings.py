@@ -41,20 +41,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'auctions.middleware.PerformanceMiddleware',
+    'auctions.middleware.ReplicaRoutingMiddleware',
+    # The stock middleware, with hooks that run on the event loop under ASGI
+    'auctions.middleware.SecurityMiddleware',
+    'auctions.middleware.SessionMiddleware',
+    'auctions.middleware.CommonMiddleware',
+    'auctions.middleware.CsrfViewMiddleware',
+    'auctions.middleware.AuthenticationMiddleware',
+    'auctions.middleware.RateLimitMiddleware',
+    'auctions.middleware.MessageMiddleware',
+    'auctions.middleware.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for auctions.middleware.PerformanceMiddleware
+        'BACKEND': 'auctions.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,11 +83,33 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # A local read replica: add it to AUCTIONS_DB_REPLICAS below and copy
+    # the primary into it with `manage.py sync_replicas`.
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    #     'CONN_MAX_AGE': 60,
+    #     'TEST': {'MIRROR': 'default'},
+    # },
 }
 
+DATABASE_ROUTERS = ['auctions.routing.ReplicaRouter']
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,3 +147,81 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Auctions
+
+# Number of listings per page on the index and category views
+AUCTIONS_PAGE_SIZE = 20
+
+# Number of comments per batch on the listing page
+AUCTIONS_COMMENTS_PAGE_SIZE = 20
+
+# Search results are ranked by relevance (bm25) when every word of the
+# query is in at most this many listings. Ranking broader queries would
+# take longer than the search itself, so only their newest matches are
+# ranked, those with every word in the title first
+AUCTIONS_SEARCH_RANKED_MATCHES = 1000
+
+# Cache alias and timeout (seconds) of the cached listing pages and index cards
+AUCTIONS_CACHE_ALIAS = 'default'
+AUCTIONS_CACHE_TIMEOUT = 300
+
+# Seconds the version counters behind those entries and the ETags are kept.
+# An expired counter restarts from a new value, which only costs misses
+AUCTIONS_CACHE_VERSION_TIMEOUT = 24 * 3600
+
+# Share of requests measured by auctions.middleware.PerformanceMiddleware.
+# Each measured request is logged as JSON to the "auctions.metrics" logger
+# at INFO level and added to the histograms served at /metrics/.
+AUCTIONS_METRICS_SAMPLE_RATE = 1.0
+
+# Broker of the live listing events streamed at /listing/<pk>/events, and
+# the seconds between keepalive messages on an idle stream
+AUCTIONS_EVENT_BROKER = 'auctions.events.InProcessBroker'
+AUCTIONS_EVENTS_KEEPALIVE = 15
+
+# Database aliases that serve reads, and the seconds a client keeps reading
+# from the primary after a write while the replicas catch up
+AUCTIONS_DB_REPLICAS = []
+AUCTIONS_DB_REPLICA_LAG = 5
+
+# Thumbnails of listing images: the fetcher, a callable returning the
+# (bytes, content type) of an image URL, the directory and byte limit of
+# their on-disk cache, and the seconds a failed fetch is not retried
+AUCTIONS_THUMBNAIL_FETCHER = 'auctions.thumbnails.fetch_url'
+AUCTIONS_THUMBNAIL_DIR = os.path.join(BASE_DIR, 'thumbnails')
+AUCTIONS_THUMBNAIL_CACHE_BYTES = 256 * 1024 * 1024
+AUCTIONS_THUMBNAIL_FAILURE_TTL = 300
+
+# Token-bucket rate limits per user, or per IP address for anonymous
+# clients, as {action: (burst, period in seconds)}: up to `burst` requests
+# at once, refilled at `burst` per `period`. "write" covers every unsafe
+# request; actions left out are unlimited. The backend keeps the buckets,
+# in process memory or, with auctions.ratelimit.CacheBackend, in the
+# AUCTIONS_CACHE_ALIAS cache shared by all workers.
+AUCTIONS_RATE_LIMITS = {
+    'write': (60, 60),
+    'bid': (10, 60),
+    'comment': (5, 60),
+    'watchlist': (30, 60),
+}
+AUCTIONS_RATE_LIMIT_BACKEND = 'auctions.ratelimit.LocalMemoryBackend'
+
+# Where send_watchlist_digests writes the digests: a class with write()
+# and close(), such as auctions.digests.FileSink to append JSON lines
+AUCTIONS_DIGEST_SINK = 'auctions.digests.ConsoleSink'
+
+# PRAGMAs run on every new SQLite connection; {} keeps SQLite's defaults.
+# WAL lets readers run alongside the single writer, and NORMAL syncs only
+# at checkpoints, which is still safe against corruption in WAL mode.
+# Waits up to busy_timeout ms for a lock instead of failing at once, maps
+# up to 256 MiB of the file and caches up to 64 MiB of pages (negative
+# cache_size is in KiB) per connection.
+AUCTIONS_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}